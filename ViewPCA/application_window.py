@@ -4,14 +4,25 @@ import os
 
 import numpy as np
 from PySide2.QtCharts import QtCharts
-from PySide2.QtCore import QEvent, QFile, QObject, QPointF, QRectF, Qt
+from PySide2.QtCore import QEvent, QObject, QPointF, QRectF, Qt, QTimer
 from PySide2.QtGui import QBrush, QColor, QPainter, QPen
-from PySide2.QtUiTools import QUiLoader
-from PySide2.QtWidgets import (QFileDialog, QFrame, QGraphicsDropShadowEffect,
-                               QGraphicsEllipseItem, QGraphicsTextItem, QLabel,
-                               QPushButton, QRadioButton, QTabWidget)
+from PySide2.QtWidgets import (QDialog, QFileDialog, QFrame,
+                               QGraphicsDropShadowEffect, QGraphicsEllipseItem,
+                               QGraphicsTextItem, QLabel, QPushButton,
+                               QRadioButton, QSpinBox, QTabWidget, QVBoxLayout)
 
-from ViewPCA.table import Table
+from ViewPCA import plotting, resources
+from ViewPCA.table import DEFAULT_COMPONENTS, Table
+
+
+def padded_range(low, high, fraction=0.15):
+    low, high = low - fraction * np.fabs(low), high + fraction * np.fabs(high)
+
+    # the chart crashes on an empty axis range. All the scores are 0 when a table holds one sample
+    if not high > low:
+        low, high = low - 1.0, high + 1.0
+
+    return float(low), float(high)
 
 
 class TextEventFilter(QObject):
@@ -37,8 +48,6 @@ class ApplicationWindow(QObject):
     def __init__(self):
         QObject.__init__(self)
 
-        self.module_path = os.path.dirname(__file__)
-
         self.mouse_pressed = False
         self.draw_ellipse = False
         self.write_text = False
@@ -52,11 +61,7 @@ class ApplicationWindow(QObject):
 
         # loading widgets from designer file
 
-        loader = QUiLoader()
-
-        loader.registerCustomWidget(QtCharts.QChartView)
-
-        self.window = loader.load(self.module_path + "/ui/application_window.ui")
+        self.window = resources.load_ui("application_window.ui")
 
         self.tab_widget = self.window.findChild(QTabWidget, "tab_widget")
         chart_frame = self.window.findChild(QFrame, "chart_frame")
@@ -65,6 +70,10 @@ class ApplicationWindow(QObject):
         button_add_tab = self.window.findChild(QPushButton, "button_add_tab")
         button_reset_zoom = self.window.findChild(QPushButton, "button_reset_zoom")
         button_save_image = self.window.findChild(QPushButton, "button_save_image")
+        button_scree_plot = self.window.findChild(QPushButton, "button_scree_plot")
+        self.spinbox_components = self.window.findChild(QSpinBox, "spinbox_components")
+        self.spinbox_axis_x = self.window.findChild(QSpinBox, "spinbox_axis_x")
+        self.spinbox_axis_y = self.window.findChild(QSpinBox, "spinbox_axis_y")
         self.label_mouse_coords = self.window.findChild(QLabel, "label_mouse_coords")
         self.radio_zoom = self.window.findChild(QRadioButton, "radio_zoom")
         self.radio_ellipse = self.window.findChild(QRadioButton, "radio_ellipse")
@@ -89,22 +98,27 @@ class ApplicationWindow(QObject):
         self.chart.addAxis(self.axis_x, Qt.AlignBottom)
         self.chart.addAxis(self.axis_y, Qt.AlignLeft)
 
+        # the level of detail of the series is recomputed once after a burst of range changes
+
+        self.lod_timer = QTimer(self)
+        self.lod_timer.setSingleShot(True)
+        self.lod_timer.setInterval(50)
+
         self.chart_view.setChart(self.chart)
         self.chart_view.setRenderHint(QPainter.Antialiasing)
         self.chart_view.setRubberBand(QtCharts.QChartView.RectangleRubberBand)
 
+        self.spinbox_components.setValue(DEFAULT_COMPONENTS)
+        self.spinbox_axis_x.setMaximum(DEFAULT_COMPONENTS)
+        self.spinbox_axis_y.setMaximum(DEFAULT_COMPONENTS)
+
         # 1 tab by default
 
         self.add_tab()
 
         # custom stylesheet
 
-        style_file = QFile(self.module_path + "/ui/custom.css")
-        style_file.open(QFile.ReadOnly)
-
-        self.window.setStyleSheet(style_file.readAll().data().decode("utf-8"))
-
-        style_file.close()
+        self.window.setStyleSheet(resources.stylesheet("custom.css"))
 
         # effects
 
@@ -114,6 +128,7 @@ class ApplicationWindow(QObject):
         button_add_tab.setGraphicsEffect(self.button_shadow())
         button_reset_zoom.setGraphicsEffect(self.button_shadow())
         button_save_image.setGraphicsEffect(self.button_shadow())
+        button_scree_plot.setGraphicsEffect(self.button_shadow())
 
         # signal connection
 
@@ -121,9 +136,16 @@ class ApplicationWindow(QObject):
         button_add_tab.clicked.connect(self.add_tab)
         button_reset_zoom.clicked.connect(self.reset_zoom)
         button_save_image.clicked.connect(self.save_image)
+        button_scree_plot.clicked.connect(self.show_scree_plot)
+        self.spinbox_components.valueChanged.connect(self.on_components_changed)
+        self.spinbox_axis_x.valueChanged.connect(self.on_axes_changed)
+        self.spinbox_axis_y.valueChanged.connect(self.on_axes_changed)
         self.radio_zoom.toggled.connect(self.on_mouse_function_changed)
         self.radio_ellipse.toggled.connect(self.on_mouse_function_changed)
         self.radio_text.toggled.connect(self.on_mouse_function_changed)
+        self.axis_x.rangeChanged.connect(self.lod_timer.start)
+        self.axis_y.rangeChanged.connect(self.lod_timer.start)
+        self.lod_timer.timeout.connect(self.update_level_of_detail)
 
         # event filter
 
@@ -170,6 +192,12 @@ class ApplicationWindow(QObject):
 
         table.model.dataChanged.connect(self.update_scale)
         table.new_mouse_coords.connect(self.on_new_mouse_coords)
+        table.basis_changed.connect(self.update_basis_choices)
+
+        # components
+
+        table.n_components = self.spinbox_components.value()
+        table.set_axes(*self.get_axes())
 
         # add table
 
@@ -179,6 +207,8 @@ class ApplicationWindow(QObject):
 
         self.tab_widget.addTab(table.main_widget, "table " + str(len(self.tables)))
 
+        self.update_basis_choices()
+
     def remove_tab(self, index):
         widget = self.tab_widget.widget(index)
 
@@ -189,37 +219,86 @@ class ApplicationWindow(QObject):
                 self.chart.removeSeries(t.series)
                 self.chart.removeSeries(t.series_selection)
 
+                t.release()
+
                 self.tables.remove(t)
 
+                self.update_basis_choices()
                 self.update_scale()
 
                 break
 
     def update_scale(self):
-        n_tables = len(self.tables)
+        # tables whose samples were all removed have no extent
+        extents = [extent for extent in (t.model.get_min_max_xy() for t in self.tables) if extent is not None]
+
+        if len(extents) > 0:
+            Xmin, Xmax, Ymin, Ymax = extents[0]
 
-        if n_tables > 0:
-            Xmin, Xmax, Ymin, Ymax = self.tables[0].model.get_min_max_xy()
+            for xmin, xmax, ymin, ymax in extents[1:]:
+                if xmin < Xmin:
+                    Xmin = xmin
 
-            if n_tables > 1:
-                for n in range(n_tables):
-                    xmin, xmax, ymin, ymax = self.tables[n].model.get_min_max_xy()
+                if xmax > Xmax:
+                    Xmax = xmax
 
-                    if xmin < Xmin:
-                        Xmin = xmin
+                if ymin < Ymin:
+                    Ymin = ymin
 
-                    if xmax > Xmax:
-                        Xmax = xmax
+                if ymax > Ymax:
+                    Ymax = ymax
 
-                    if ymin < Ymin:
-                        Ymin = ymin
+            self.axis_x.setRange(*padded_range(Xmin, Xmax))
+            self.axis_y.setRange(*padded_range(Ymin, Ymax))
 
-                    if ymax > Ymax:
-                        Ymax = ymax
+    def basis_references(self):
+        # only tables with their own fit can be projected onto. It keeps the projections from forming a cycle
+        return [(self.tab_widget.tabText(self.tab_widget.indexOf(t.main_widget)), t) for t in self.tables
+                if t.basis is None]
 
-            fraction = 0.15
-            self.axis_x.setRange(Xmin - fraction * np.fabs(Xmin), Xmax + fraction * np.fabs(Xmax))
-            self.axis_y.setRange(Ymin - fraction * np.fabs(Ymin), Ymax + fraction * np.fabs(Ymax))
+    def update_basis_choices(self):
+        for t in self.tables:
+            # read again for each table. A table that loses its basis changes the references
+            t.set_basis_choices([(name, r) for name, r in self.basis_references() if r is not t])
+
+    def get_axes(self):
+        return self.spinbox_axis_x.value() - 1, self.spinbox_axis_y.value() - 1
+
+    def on_components_changed(self, n_components):
+        # the plotted components must be among the computed ones
+        self.spinbox_axis_x.setMaximum(n_components)
+        self.spinbox_axis_y.setMaximum(n_components)
+
+        for t in self.tables:
+            t.set_n_components(n_components)
+
+    def on_axes_changed(self, value):
+        pc_x, pc_y = self.get_axes()
+
+        self.axis_x.setTitleText("PC{}".format(pc_x + 1))
+        self.axis_y.setTitleText("PC{}".format(pc_y + 1))
+
+        for t in self.tables:
+            t.set_axes(pc_x, pc_y)
+
+    def show_scree_plot(self):
+        spectra = [(t.series.name(), t.explained_variance_ratio) for t in self.tables]
+
+        dialog = QDialog(self.window)
+        dialog.setWindowTitle("Scree Plot")
+        dialog.resize(600, 400)
+
+        chart_view = QtCharts.QChartView(plotting.scree_chart(spectra), dialog)
+        chart_view.setRenderHint(QPainter.Antialiasing)
+
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(chart_view)
+
+        dialog.exec_()
+
+    def update_level_of_detail(self):
+        for t in self.tables:
+            t.update_series()
 
     def save_image(self):
         home = os.path.expanduser("~")
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ViewPCA import engine, sparse, stats
+
+# the budget can be changed with the VIEWPCA_CACHE_MB environment variable
+DEFAULT_MAX_BYTES = int(os.environ.get("VIEWPCA_CACHE_MB", 1024)) * 2 ** 20
+
+
+def sizeof(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, tuple):
+        return sum(sizeof(v) for v in value)
+
+    if isinstance(value, (engine.Result, stats.Moments)):
+        return sum(v.nbytes for v in vars(value).values() if isinstance(v, np.ndarray))
+
+    return 0
+
+
+def file_key(path):
+    """
+        Identifies the file contents without reading them. A rewritten file gets a new modification time and size.
+    """
+
+    stat = os.stat(path)
+
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class Cache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            self.entries.move_to_end(key)
+
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        nbytes = sizeof(value)
+
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+            self.evict()
+
+    def evict(self):
+        while self.nbytes > self.max_bytes and self.entries:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+
+            self.nbytes -= nbytes
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+
+            self.evict()
+
+    def discard(self, source_key):
+        # removes every entry computed from the same source
+
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == source_key]:
+                self.nbytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def fetch(self, key, compute):
+        value = self.get(key)
+
+        if value is None:
+            value = compute()
+
+            self.put(key, value)
+
+        return value
+
+
+# shared by all tables so that the budget is global
+shared = Cache()
+
+
+def result_key(source_key, settings, n_components=2, **solver_options):
+    return (source_key, settings.key(), n_components, tuple(sorted(solver_options.items())))
+
+
+def run(store, source_key, matrix, settings, n_components=2, token=None, compute_statistics=None, **solver_options):
+    """
+        engine.run with the preprocessed matrix and the fitted result kept in store. For tall matrices and settings
+        that only shift and scale the columns the result is derived from the statistics of the raw matrix, gathered
+        once per matrix by compute_statistics (in this thread when it is not given).
+    """
+
+    if engine.is_sparse(matrix):
+        # the preprocessing stays implicit in the sparse fit. There is no dense matrix worth caching
+        return store.fetch(result_key(source_key, settings, n_components, **solver_options),
+                           lambda: sparse.fit(matrix, settings, n_components=n_components, token=token,
+                                              columns=columns(store, source_key, matrix, settings, token),
+                                              **solver_options))
+
+    if stats.derivable(matrix.shape, settings):
+        if compute_statistics is None:
+            compute_statistics = functools.partial(stats.Statistics.from_matrix, matrix, token)
+
+        def derived():
+            statistics = store.fetch((source_key, "statistics"), compute_statistics)
+
+            return statistics.fit(matrix, settings, n_components=n_components, token=token)
+
+        return store.fetch(result_key(source_key, settings, n_components), derived)
+
+    def transform():
+        return columns(store, source_key, matrix, settings, token)
+
+    def preprocessed():
+        if settings.method == "none" and not engine.needs_cast(matrix, settings):
+            return matrix  # PCA does not write into its input. There is nothing worth caching
+
+        return store.fetch((source_key, settings.key()),
+                           lambda: engine.preprocess(matrix, settings, token=token, columns=transform()))
+
+    def fitted():
+        result = engine.fit(preprocessed(), n_components=n_components, **solver_options)
+
+        return result.set_preprocessing(settings, *transform())
+
+    return store.fetch(result_key(source_key, settings, n_components, **solver_options), fitted)
+
+
+def columns(store, source_key, matrix, settings, token=None):
+    # the column statistics are small. They are kept so that results can be projected onto without another pass
+    return store.fetch((source_key, settings.key(), "columns"),
+                       lambda: engine.column_transform(matrix, settings, token))
+
+
+def refit(store, source_key, matrix, settings, kept, n_components=2, token=None):
+    """
+        Pca of the kept rows, preprocessed as if they were the whole matrix. The moments of the full matrix are
+        computed once and kept in store, so each removal only subtracts the removed rows from them.
+    """
+
+    kept = np.asarray(kept)
+
+    if engine.is_sparse(matrix) or matrix.shape[1] > stats.MAX_MOMENT_FEATURES:
+        # fitted again on the kept rows, with their own column statistics
+        return engine.run(matrix[kept], settings, n_components=n_components, token=token)
+
+    if settings.method != "none" and settings.axis == "features":
+        # the column offsets and divisors depend on the rows. They come from the statistics of the raw matrix, the
+        # same ones the derived fits use
+        statistics = store.fetch((source_key, "statistics"),
+                                 lambda: stats.Statistics.from_matrix(matrix, token))
+
+        return statistics.refit(matrix, kept, settings, n_components=n_components, token=token)
+
+    if settings.method == "none" and not engine.needs_cast(matrix, settings):
+        preprocessed = matrix
+    else:
+        preprocessed = store.fetch((source_key, settings.key()),
+                                   lambda: engine.preprocess(matrix, settings, token=token))
+
+    moments = store.fetch((source_key, settings.key(), "moments"),
+                          lambda: stats.Moments.from_matrix(preprocessed, token))
+
+    # each sample is preprocessed alone. There are no column statistics to update
+    return stats.refit(preprocessed, kept, n_components=n_components, moments=moments,
+                       token=token).set_preprocessing(settings)
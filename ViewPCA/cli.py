@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import sys
+
+import h5py
+
+from ViewPCA import columnar, engine, loaders, persist, streaming
+
+COMMANDS = ("project",)
+
+
+def positive_int(text):
+    value = int(text)
+
+    if value < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive integer".format(text))
+
+    return value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="viewpca", description="Principal Component Analysis without the GUI")
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    project = subparsers.add_parser("project", help="preprocess, fit and project a pca_matrix file")
+
+    project.add_argument("input", help="hdf5 file with a pca_matrix dataset, npy file or csv, tsv, parquet or arrow "
+                                       "table")
+    project.add_argument("--label-column", help="column of a table with the sample names")
+    project.add_argument("-o", "--output", help="hdf5 file where the scores are saved. Defaults to csv on stdout")
+    project.add_argument("--method", choices=engine.PREPROCESSING_METHODS, default="normalize")
+    project.add_argument("--axis", choices=engine.PREPROCESSING_AXES, default="samples")
+    project.add_argument("--norm", choices=engine.PREPROCESSING_NORMS, default="max")
+    project.add_argument("--precision", choices=engine.PRECISIONS, default="auto",
+                         help="floating point type of the computation. auto keeps the type of the file")
+    project.add_argument("--check-precision", action="store_true",
+                         help="also fit in float32 and float64 and print how far apart the results are")
+    project.add_argument("--components", type=positive_int, default=2,
+                         help="number of principal components. It is clipped to what the matrix and solver allow")
+    project.add_argument("--solver", choices=engine.SOLVERS, default="auto",
+                         help="svd backend. auto picks one from the matrix shape")
+    project.add_argument("--oversampling", type=int, default=10, help="extra random vectors of the randomized solver")
+    project.add_argument("--power-iterations", type=int, help="power iterations of the randomized solver")
+    project.add_argument("--streaming", action="store_true",
+                         help="read the matrix in batches and fit an IncrementalPCA")
+    project.add_argument("--batch-size", type=int, help="rows per batch in streaming mode")
+    project.add_argument("--persist", action="store_true",
+                         help="reuse the result stored next to the input by an earlier run, or store this one")
+
+    return parser
+
+
+def write_scores(path, labels, result):
+    with h5py.File(path, "w") as f:
+        dset = f.create_dataset("pca_scores", data=result.scores)
+
+        loaders.write_labels(f, dset, labels)
+        dset.attrs["explained_variance_ratio"] = result.explained_variance_ratio
+        dset.attrs["singular_values"] = result.singular_values
+
+        f.create_dataset("pca_components", data=result.components)
+        f.create_dataset("pca_mean", data=result.mean)
+
+
+def print_scores(labels, result, stream):
+    n_components = result.scores.shape[1]
+
+    stream.write("name," + ",".join("PC{}".format(n + 1) for n in range(n_components)) + "\n")
+
+    for label, row in zip(labels, result.scores):
+        stream.write("{},".format(label) + ",".join("{0:.6e}".format(v) for v in row) + "\n")
+
+
+def clip_components(args, shape, solver):
+    n_components = engine.clip_components(shape, args.components, solver)
+
+    if n_components != args.components:
+        sys.stderr.write("--components {} is more than the {}x{} matrix allows with the {} solver, {} are computed\n"
+                         .format(args.components, shape[0], shape[1], solver, n_components))
+
+    return n_components
+
+
+def project(args):
+    settings = engine.Settings(method=args.method, axis=args.axis, norm=args.norm, precision=args.precision)
+
+    if args.label_column:
+        columnar.LABEL_COLUMN = args.label_column
+
+    if args.streaming:
+        labels = loaders.load_labels(args.input)
+        n_components = clip_components(args, loaders.load_shape(args.input), "auto")
+
+        def compute():
+            return streaming.run_file(args.input, settings, n_components=n_components, batch_size=args.batch_size)
+    else:
+        matrix, labels = loaders.load(args.input)
+        n_components = clip_components(args, matrix.shape, args.solver)
+
+        power_iterations = "auto" if args.power_iterations is None else args.power_iterations
+
+        def compute():
+            return engine.run(matrix, settings, n_components=n_components, solver=args.solver,
+                              oversampling=args.oversampling, power_iterations=power_iterations)
+
+    if args.persist:
+        result = persist.fetch(args.input, settings, n_components, compute)
+    else:
+        result = compute()
+
+    if result.solver is not None:
+        sys.stderr.write("solver: {}\n".format(result.solver))
+
+    for n in range(result.scores.shape[1]):
+        sys.stderr.write("PC{0}: {1:.1f}% (singular value {2:.1f})\n".format(
+            n + 1, result.explained_variance_ratio[n] * 100, result.singular_values[n]))
+
+    if args.check_precision:
+        if args.streaming:
+            sys.stderr.write("--check-precision needs the matrix in memory, it is ignored with --streaming\n")
+        else:
+            error = engine.compare_precision(matrix, settings, n_components=n_components, solver=args.solver)
+
+            sys.stderr.write("float32 against float64: subspace angle {0:.2e} deg, score error {1:.2e}, "
+                             "variance ratio error {2:.2e}\n".format(error["subspace_angle"], error["score_error"],
+                                                                     error["variance_ratio_error"]))
+
+    if args.output:
+        write_scores(args.output, labels, result)
+    else:
+        print_scores(labels, result, sys.stdout)
+
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "project":
+        return project(args)
+
+    return 1
@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import csv
+import multiprocessing
+import os
+import re
+
+import numpy as np
+
+from ViewPCA.labelarray import LabelArray
+
+CSV_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+
+EXTENSIONS = tuple(CSV_DELIMITERS) + PARQUET_EXTENSIONS + ARROW_EXTENSIONS
+
+# column with the sample names, the equivalent of the pca_sample_labels attribute. VIEWPCA_LABEL_COLUMN sets it. By
+# default it is a column named pca_sample_labels, or else the first column that is not numeric
+LABEL_COLUMN = os.environ.get("VIEWPCA_LABEL_COLUMN", "")
+DEFAULT_LABEL_COLUMN = "pca_sample_labels"
+
+# bytes of csv parsed by one task
+RANGE_BYTES = 16 * 2 ** 20
+
+# a line end followed by a line with only white space
+BLANK_LINE = re.compile(rb"\n[ \t\r]*(?=\n)")
+
+# an empty field of a csv line, {} being the delimiter
+EMPTY_FIELD = r"(^|{0})[ \t]*(?={0}|$)"
+
+# rows converted at once from parquet and arrow files
+BATCH_ROWS = 65536
+
+# scanned csv files, by (path, size, modification time)
+_csv_sources = {}
+
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+
+    return True
+
+
+def check_missing(block, path, first):
+    """
+        Raises when the rows of path from first on have missing values. Empty csv fields and the nulls of parquet
+        and arrow files are read as nan, so that every format stops here with the same message instead of in the fit.
+    """
+
+    missing = np.isnan(block)
+
+    if missing.any():
+        row, column = np.argwhere(missing)[0]
+
+        raise ValueError("{} has a missing value in sample {}, feature {}. Fill or drop the incomplete samples "
+                         "before opening it".format(path, first + row, column))
+
+
+def label_index(names, numeric, path):
+    """
+        Position of the label column among names, None when there is none. Every other column must be numeric.
+    """
+
+    if LABEL_COLUMN:
+        if LABEL_COLUMN not in names:
+            raise KeyError("{} has no {} column".format(path, LABEL_COLUMN))
+
+        index = names.index(LABEL_COLUMN)
+    elif DEFAULT_LABEL_COLUMN in names:
+        index = names.index(DEFAULT_LABEL_COLUMN)
+    else:
+        index = next((i for i, n in enumerate(numeric) if not n), None)
+
+    for i, name in enumerate(names):
+        if i != index and not numeric[i]:
+            raise ValueError("column {} of {} is not numeric".format(name, path))
+
+    return index
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("reading parquet and arrow files needs pyarrow")
+
+    return pyarrow
+
+
+def executor():
+    """
+        (pool, window) with the process pool the csv ranges are parsed in and the number of ranges in flight. The
+        pool is None to parse them in this process. A worker that streams a file parses it by itself instead of
+        starting a pool of its own.
+    """
+
+    from ViewPCA import workers
+
+    if not workers.enabled() or multiprocessing.parent_process() is not None:
+        return None, 1
+
+    return workers.get_executor(), 2 * workers.MAX_WORKERS
+
+
+def ordered_map(function, tasks, pool=None, window=1):
+    """
+        Yields function(*task) for each task in order. At most window tasks are in flight, which bounds the memory
+        taken by parsed ranges waiting to be consumed.
+    """
+
+    if pool is None:
+        for task in tasks:
+            yield function(*task)
+
+        return
+
+    pending = collections.deque()
+
+    try:
+        for task in tasks:
+            pending.append(pool.submit(function, *task))
+
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # the reader stopped early, after a cancel or an error
+        for future in pending:
+            future.cancel()
+
+
+def parse_csv_range(path, start, stop, delimiter, columns, label):
+    """
+        Numeric columns and labels (a LabelArray, cheaper to send back than str objects) of the lines in the bytes
+        [start, stop) of a csv file. Either is None when columns or label is None. Runs in the worker processes.
+    """
+
+    with open(path, "rb") as f:
+        f.seek(start)
+
+        lines = [line for line in f.read(stop - start).decode("utf-8").splitlines() if line.strip()]
+
+    block, names = None, None
+
+    if columns is not None:
+        try:
+            block = np.loadtxt(lines, delimiter=delimiter, usecols=columns, quotechar='"', ndmin=2, dtype=np.float64)
+        except ValueError:
+            # only parsed again when loadtxt fails. Empty fields become nan, caught by check_missing like the nulls
+            # of the other formats. Any other text still fails
+            empty = re.compile(EMPTY_FIELD.format(re.escape(delimiter)))
+
+            block = np.loadtxt([empty.sub(r"\1nan", line) for line in lines], delimiter=delimiter, usecols=columns,
+                               quotechar='"', ndmin=2, dtype=np.float64)
+
+    if label is not None:
+        names = LabelArray.from_strings([row[label] for row in csv.reader(lines, delimiter=delimiter)])
+
+    return block, names
+
+
+class CsvSource:
+    """
+        Csv or tsv file with one sample per line and an optional header. The file is cut in ranges of lines that
+        are parsed in parallel by the worker processes and consumed in order.
+    """
+
+    chunks = None  # read like an unchunked dataset by streaming.row_batches
+
+    def __init__(self, path, progress=None):
+        self.path = path
+        self.delimiter = CSV_DELIMITERS[os.path.splitext(path)[1].lower()]
+        self.dtype = np.dtype(np.float64)
+
+        with open(path, "rb") as f:
+            first = f.readline()
+            second = f.readline()
+
+        rows = list(csv.reader([line.decode("utf-8-sig") for line in (first, second) if line.strip()],
+                               delimiter=self.delimiter))
+
+        if not rows:
+            raise KeyError("{} has no samples".format(path))
+
+        data = rows[-1]
+
+        # a header has text where the samples have numbers
+        has_header = len(rows) > 1 and any(not is_number(a) and is_number(b) for a, b in zip(rows[0], data))
+
+        names = rows[0] if has_header else [str(i) for i in range(len(data))]
+        numeric = [is_number(v) for v in data]
+
+        self.label = label_index(names, numeric, path)
+        self.columns = [i for i in range(len(names)) if i != self.label]
+        self.start = len(first) if has_header else 0
+
+        self.ranges = self.split(progress)
+        self.shape = (sum(n for _, _, n in self.ranges), len(self.columns))
+        self.nbytes = self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def split(self, progress=None):
+        """
+            (start, stop, samples) of ranges of about RANGE_BYTES ending at line ends. The lines are counted in one
+            fast pass over the bytes. Blank lines are not samples.
+        """
+
+        size = os.path.getsize(self.path)
+
+        with open(self.path, "rb") as f:
+            tail = max(self.start, size - 4096)
+
+            f.seek(tail)
+
+            end = tail + len(f.read().rstrip())
+
+            if progress is not None:
+                progress.start("counting lines", end - self.start)
+
+            ranges = []
+            start = self.start
+
+            while start < end:
+                f.seek(start)
+
+                data = f.read(min(RANGE_BYTES, end - start))
+
+                if start + len(data) < end and not data.endswith(b"\n"):
+                    data += f.readline()  # up to the end of the last line
+
+                data = data[:end - start]
+
+                lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1) - len(BLANK_LINE.findall(b"\n" + data))
+
+                ranges.append((start, start + len(data), lines))
+
+                start += len(data)
+
+                if progress is not None:
+                    progress.advance(len(data))
+
+        return ranges
+
+    def parse(self, columns, label, progress=None):
+        pool, window = executor() if len(self.ranges) > 1 else (None, 1)
+
+        tasks = ((self.path, start, stop, self.delimiter, columns, label) for start, stop, _ in self.ranges)
+
+        if progress is not None:
+            progress.start("parsing", sum(stop - start for start, stop, _ in self.ranges))
+
+        for (start, stop, _), parsed in zip(self.ranges, ordered_map(parse_csv_range, tasks, pool, window)):
+            if progress is not None:
+                progress.advance(stop - start)
+
+            yield parsed
+
+    def read_chunks(self, labels=False, progress=None):
+        """
+            Yields the matrix in consecutive blocks of rows, as (block, labels) with labels.
+        """
+
+        first = 0
+
+        for block, names in self.parse(self.columns, self.label if labels else None, progress):
+            check_missing(block, self.path, first)
+
+            if labels and names is None:
+                # files without a label column name the samples after their row, like npy files
+                names = LabelArray.row_names(block.shape[0], first)
+
+            yield (block, names) if labels else block
+
+            first += block.shape[0]
+
+    def labels(self, progress=None):
+        if self.label is None:
+            return LabelArray.row_names(self.shape[0])
+
+        return LabelArray.concatenate(names for _, names in self.parse(None, self.label, progress))
+
+
+def label_array(pyarrow, column):
+    """
+        LabelArray of an arrow column. The offsets and bytes of its string form are used as they are. Integer ids
+        are cast to their text like the labels of the other formats, missing names are empty.
+    """
+
+    column = column.cast(pyarrow.large_string())
+
+    _, offsets, data = column.buffers()
+
+    offsets = np.frombuffer(offsets, dtype=np.int64)[column.offset:column.offset + len(column) + 1]
+    data = np.frombuffer(data, dtype=np.uint8) if data is not None else np.array([], dtype=np.uint8)
+
+    return LabelArray(offsets - offsets[0], data[offsets[0]:offsets[-1]])
+
+
+def numeric_type(pyarrow, data_type):
+    return pyarrow.types.is_integer(data_type) or pyarrow.types.is_floating(data_type)
+
+
+class ArrowSource:
+    """
+        Parquet or arrow ipc (feather) file. Numeric columns are the features. A single fixed size list column, as
+        written for embeddings, is taken as the whole matrix and its values are viewed without a copy. pyarrow reads
+        the row groups with its own threads.
+    """
+
+    chunks = None
+
+    def __init__(self, path):
+        pyarrow = import_pyarrow()
+
+        self.pyarrow = pyarrow
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() in PARQUET_EXTENSIONS
+
+        if self.parquet:
+            import pyarrow.parquet
+
+            self.file = pyarrow.parquet.ParquetFile(path, memory_map=True)
+
+            schema = self.file.schema_arrow
+            n_rows = self.file.metadata.num_rows
+        else:
+            import pyarrow.ipc
+
+            # the batches of a mapped ipc file point into the mapping. Nothing is read before it is used
+            self.file = pyarrow.ipc.open_file(pyarrow.memory_map(path, "r"))
+
+            schema = self.file.schema
+            n_rows = sum(self.file.get_batch(i).num_rows for i in range(self.file.num_record_batches))
+
+        names = list(schema.names)
+        types = [schema.field(name).type for name in names]
+
+        vector = [pyarrow.types.is_fixed_size_list(t) and numeric_type(pyarrow, t.value_type) for t in types]
+        numeric = [numeric_type(pyarrow, t) or v for t, v in zip(types, vector)]
+
+        self.label = label_index(names, numeric, path)
+        self.columns = [name for i, name in enumerate(names) if i != self.label]
+        self.label_name = names[self.label] if self.label is not None else None
+
+        vectors = [i for i, name in enumerate(names) if vector[i] and i != self.label]
+
+        if vectors and len(self.columns) > 1:
+            raise ValueError("{} mixes list and scalar feature columns".format(path))
+
+        if vectors:
+            value_type = types[vectors[0]].value_type
+            n_cols = types[vectors[0]].list_size
+        else:
+            value_type = None
+            n_cols = len(self.columns)
+
+        self.vector = bool(vectors)
+        dtype = np.dtype(np.result_type(*[t.to_pandas_dtype() for t in (
+            [value_type] if self.vector else [types[names.index(c)] for c in self.columns])]))
+
+        # missing values become nan, which integers cannot hold. Integer features are read as float64
+        self.dtype = dtype if dtype.kind == "f" else np.dtype(np.float64)
+        self.shape = (n_rows, n_cols)
+        self.nbytes = n_rows * n_cols * self.dtype.itemsize
+
+    def batches(self, columns):
+        if self.parquet:
+            yield from self.file.iter_batches(batch_size=BATCH_ROWS, columns=columns)
+        else:
+            for i in range(self.file.num_record_batches):
+                yield self.file.get_batch(i).select(columns)
+
+    def to_matrix(self, batch):
+        if self.vector:
+            column = batch.column(0)
+
+            # the values of a fixed size list are contiguous, row after row
+            values = column.flatten().to_numpy(zero_copy_only=False).reshape(-1, self.shape[1])
+
+            if column.null_count == 0:
+                return values.astype(self.dtype, copy=False)
+
+            # flatten skips the null lists. Their rows are nan, like null scalars
+            block = np.full((batch.num_rows, self.shape[1]), np.nan, dtype=self.dtype)
+            block[column.is_valid().to_numpy(zero_copy_only=False)] = values
+
+            return block
+
+        block = np.empty((batch.num_rows, self.shape[1]), dtype=self.dtype)
+
+        for j in range(self.shape[1]):
+            # missing values become nan, see the dtype chosen in __init__
+            block[:, j] = batch.column(j).to_numpy(zero_copy_only=False)
+
+        return block
+
+    def read_chunks(self, labels=False, progress=None):
+        columns = self.columns + ([self.label_name] if labels and self.label_name is not None else [])
+
+        if progress is not None:
+            progress.start("decoding", self.nbytes)
+
+        first = 0
+
+        for batch in self.batches(columns):
+            block = self.to_matrix(batch)
+
+            check_missing(block, self.path, first)
+
+            if progress is not None:
+                progress.advance(block.nbytes)
+
+            if not labels:
+                yield block
+            elif self.label_name is None:
+                yield block, LabelArray.row_names(batch.num_rows, first)
+            else:
+                yield block, label_array(self.pyarrow, batch.column(len(self.columns)))
+
+            first += batch.num_rows
+
+    def labels(self, progress=None):
+        # a single column, read without a progress report. The token of progress is still checked between batches
+        if self.label_name is None:
+            return LabelArray.row_names(self.shape[0])
+
+        names = []
+
+        for batch in self.batches([self.label_name]):
+            names.append(label_array(self.pyarrow, batch.column(0)))
+
+            if progress is not None:
+                progress.check()
+
+        return LabelArray.concatenate(names)
+
+
+def open_source(path, progress=None):
+    if os.path.splitext(path)[1].lower() not in CSV_DELIMITERS:
+        return ArrowSource(path)
+
+    # the lines are counted once per version of the file. Opening a table asks for the size, the labels and the
+    # matrix in turn
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    if key not in _csv_sources:
+        _csv_sources[key] = CsvSource(path, progress)
+
+    return _csv_sources[key]
+
+
+def load(path, allocate, progress=None):
+    """
+        Reads the matrix block by block into the array returned by allocate(shape, dtype). Only the matrix and one
+        block per parsing task are in memory, never a whole data frame.
+    """
+
+    source = open_source(path, progress)
+
+    matrix = allocate(source.shape, source.dtype)
+    labels = []
+
+    start = 0
+
+    for block, names in source.read_chunks(labels=True, progress=progress):
+        if start + block.shape[0] > matrix.shape[0]:
+            raise ValueError("{} has more samples than lines were counted. Are there quoted line breaks?".format(path))
+
+        matrix[start:start + block.shape[0]] = block
+        labels.append(names)
+
+        start += block.shape[0]
+
+    if start != matrix.shape[0]:
+        raise ValueError("{} has {} samples but {} lines were counted".format(path, start, matrix.shape[0]))
+
+    return matrix, LabelArray.concatenate(labels)
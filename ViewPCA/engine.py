@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import sys
+import threading
+from importlib import metadata
+
+import numpy as np
+
+from ViewPCA import instrument
+
+PREPROCESSING_METHODS = ("none", "normalize", "standardize")
+PREPROCESSING_AXES = ("samples", "features")
+PREPROCESSING_NORMS = ("l1", "l2", "max")
+SOLVERS = ("auto", "full", "randomized", "arpack", "covariance_eigh")
+
+# floating point type of the preprocessed matrix, the decomposition and the scores. auto keeps floating point
+# matrices at the type they are stored with and computes integer ones in float64
+PRECISIONS = ("auto", "float32", "float64")
+
+
+def sklearn_version():
+    # read from the package metadata. sklearn takes longer to import than the window takes to open, so it is only
+    # imported by the first fit
+    try:
+        return metadata.version("scikit-learn")
+    except metadata.PackageNotFoundError:
+        import sklearn
+
+        return sklearn.__version__
+
+
+# the covariance_eigh solver was added in scikit-learn 1.5
+HAS_COVARIANCE_EIGH = tuple(int(v) for v in sklearn_version().split(".")[:2]) >= (1, 5)
+
+# rows preprocessed at once. It bounds the size of the temporary arrays
+BLOCK_ROWS = 4096
+
+
+class Cancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+        Checked by long computations between steps so that a superseded job stops early.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled()
+
+
+class Settings:
+    def __init__(self, method="normalize", axis="samples", norm="max", precision="auto"):
+        if method not in PREPROCESSING_METHODS:
+            raise ValueError("unknown preprocessing method: {}".format(method))
+
+        if axis not in PREPROCESSING_AXES:
+            raise ValueError("unknown preprocessing axis: {}".format(axis))
+
+        if norm not in PREPROCESSING_NORMS:
+            raise ValueError("unknown preprocessing norm: {}".format(norm))
+
+        if precision not in PRECISIONS:
+            raise ValueError("unknown precision: {}".format(precision))
+
+        self.method = method
+        self.axis = axis
+        self.norm = norm
+        self.precision = precision
+
+    def key(self):
+        """
+            Options that do not affect the selected method are left out so that equivalent settings compare equal.
+        """
+
+        if self.method == "normalize":
+            key = (self.method, self.axis, self.norm)
+        elif self.method == "standardize":
+            key = (self.method, self.axis)
+        else:
+            key = (self.method,)
+
+        # auto is left out so that the keys of the results stored before the precision setting still match
+        return key if self.precision == "auto" else key + (self.precision,)
+
+    def dtype(self, dtype):
+        """
+            Type the matrix is computed in when it is stored as dtype.
+        """
+
+        return working_dtype(dtype, self.precision)
+
+    def __eq__(self, other):
+        return isinstance(other, Settings) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return "Settings({})".format(", ".join(self.key()))
+
+
+class Result:
+    def __init__(self, pca, scores, solver=None, settings=None, offset=None, divisor=None):
+        self.components = pca.components_
+        self.mean = pca.mean_
+        self.explained_variance = pca.explained_variance_
+        self.explained_variance_ratio = pca.explained_variance_ratio_
+        self.singular_values = pca.singular_values_
+        self.scores = scores
+        self.solver = solver
+
+        # preprocessing of the fitted matrix, with the column statistics along the features axis. Other samples
+        # go through the same one when they are projected onto this basis
+        self.settings = settings if settings is not None else Settings(method="none")
+        self.offset = offset
+        self.divisor = divisor
+
+    def set_preprocessing(self, settings, offset=None, divisor=None):
+        self.settings = settings
+        self.offset = offset
+        self.divisor = divisor
+
+        return self
+
+    def projected(self, scores):
+        """
+            Result of other samples projected onto this basis.
+        """
+
+        result = copy.copy(self)
+
+        result.scores = scores
+        result.solver = "projection"
+
+        return result
+
+
+def is_sparse(matrix):
+    # scipy is only imported once a sparse file is loaded. Before that nothing can be a sparse matrix
+    scipy_sparse = sys.modules.get("scipy.sparse")
+
+    return scipy_sparse is not None and scipy_sparse.issparse(matrix)
+
+
+def is_tall(shape):
+    n_samples, n_features = shape
+
+    return n_features <= 1000 and n_samples >= 10 * n_features
+
+
+def clip_components(shape, n_components, solver="auto"):
+    # a matrix has at most min(n_samples, n_features) components. arpack finds fewer than that
+    limit = min(shape) - 1 if solver == "arpack" else min(shape)
+
+    return max(1, min(n_components, limit))
+
+
+def choose_solver(shape, n_components):
+    if is_tall(shape) and HAS_COVARIANCE_EIGH:
+        # tall matrix: the d x d covariance is cheap and its eigendecomposition replaces the n x d svd
+        return "covariance_eigh"
+
+    if min(shape) <= 500:
+        return "full"
+
+    if n_components < 0.8 * min(shape):
+        return "randomized"
+
+    return "full"
+
+
+def blocks(matrix, block_rows=BLOCK_ROWS):
+    for start in range(0, matrix.shape[0], block_rows):
+        yield start, matrix[start:start + block_rows]
+
+
+def working_dtype(dtype, precision="auto"):
+    if precision != "auto":
+        return np.dtype(precision)
+
+    return np.dtype(dtype) if np.issubdtype(dtype, np.floating) else np.dtype(np.float64)
+
+
+def needs_cast(matrix, settings):
+    # a matrix already in the working type is fitted as it is when there is no preprocessing
+    return matrix.dtype != settings.dtype(matrix.dtype)
+
+
+def sample_norms(block, norm):
+    if norm == "l1":
+        return np.abs(block).sum(axis=1)
+    elif norm == "l2":
+        return np.sqrt(np.einsum("ij,ij->i", block, block))
+
+    return np.abs(block).max(axis=1)
+
+
+def column_statistics(batches, n_cols, settings, token=None):
+    """
+        Returns (offset, divisor) for the preprocessing along the features axis. It needs a full pass over the rows
+        before any of them can be transformed. The accumulators are always float64.
+    """
+
+    if settings.method == "normalize":
+        acc = np.zeros(n_cols)
+
+        for _, batch in batches:
+            if token is not None:
+                token.check()
+
+            batch = np.abs(batch)
+
+            if settings.norm == "l1":
+                acc += batch.sum(axis=0)
+            elif settings.norm == "l2":
+                acc += np.square(batch, dtype=np.float64).sum(axis=0)
+            else:
+                np.maximum(acc, batch.max(axis=0), out=acc)
+
+        norms = np.sqrt(acc) if settings.norm == "l2" else acc
+
+        norms[norms == 0.0] = 1.0
+
+        return None, norms
+
+    # mean and variance merged batch by batch (Chan et al.) to avoid the cancellation of sum of squares
+
+    count = 0
+    mean = np.zeros(n_cols)
+    m2 = np.zeros(n_cols)
+
+    for _, batch in batches:
+        if token is not None:
+            token.check()
+
+        n = batch.shape[0]
+        batch_mean = batch.mean(axis=0, dtype=np.float64)
+        batch_m2 = np.square(batch - batch_mean).sum(axis=0)
+
+        delta = batch_mean - mean
+        total = count + n
+
+        mean += delta * n / total
+        m2 += batch_m2 + np.square(delta) * count * n / total
+        count = total
+
+    std = np.sqrt(m2 / max(count, 1))
+
+    std[std == 0.0] = 1.0
+
+    return mean, std
+
+
+def preprocess_block(block, settings, offset=None, divisor=None, out=None):
+    """
+        Preprocesses a group of rows. Along the features axis offset and divisor come from column_statistics.
+    """
+
+    dtype = settings.dtype(block.dtype)
+    block = np.asarray(block, dtype=dtype)
+
+    if out is None:
+        out = np.empty(block.shape, dtype=dtype)
+
+    if settings.method == "none":
+        np.copyto(out, block)
+    elif settings.axis == "features":
+        if offset is not None:
+            np.subtract(block, offset.astype(dtype), out=out)
+            out /= divisor.astype(dtype)
+        else:
+            np.divide(block, divisor.astype(dtype), out=out)
+    elif settings.method == "normalize":
+        norms = sample_norms(block, settings.norm)
+
+        norms[norms == 0.0] = 1.0
+
+        np.divide(block, norms[:, np.newaxis], out=out)
+    else:
+        mean = block.mean(axis=1, keepdims=True)
+        std = block.std(axis=1, keepdims=True)
+
+        std[std == 0.0] = 1.0
+
+        np.subtract(block, mean, out=out)
+        out /= std
+
+    return out
+
+
+def column_transform(matrix, settings, token=None):
+    """
+        (offset, divisor) of the preprocessing, (None, None) when it works on each sample alone.
+    """
+
+    if is_sparse(matrix):
+        from ViewPCA import sparse
+
+        return sparse.column_transform(matrix, settings)
+
+    if settings.method != "none" and settings.axis == "features":
+        with instrument.stage("column_statistics"):
+            return column_statistics(blocks(matrix), matrix.shape[1], settings, token)
+
+    return None, None
+
+
+def preprocess(matrix, settings, out=None, token=None, columns=None):
+    """
+        The input is only read, so it can be a read only memmap. The result goes to a single working buffer.
+        columns is the (offset, divisor) from column_transform when it is already known.
+    """
+
+    offset, divisor = columns if columns is not None else column_transform(matrix, settings, token)
+
+    with instrument.stage("preprocess"):
+        if out is None:
+            out = np.empty(matrix.shape, dtype=settings.dtype(matrix.dtype))
+
+        for start, block in blocks(matrix):
+            if token is not None:
+                token.check()
+
+            preprocess_block(block, settings, offset, divisor, out=out[start:start + block.shape[0]])
+
+    return out
+
+
+def project(matrix, components, mean, token=None, dtype=None):
+    """
+        Scores of the rows of matrix in the basis of a fitted pca, computed block by block. With dtype the basis is
+        cast to it, so that a float32 matrix is projected with single precision products.
+    """
+
+    if dtype is None:
+        dtype = np.result_type(components.dtype, np.float32)
+    else:
+        components = components.astype(dtype, copy=False)
+        mean = mean.astype(dtype, copy=False)
+
+    scores = np.empty((matrix.shape[0], components.shape[0]), dtype=dtype)
+
+    with instrument.stage("project"):
+        for start, block in blocks(matrix):
+            if token is not None:
+                token.check()
+
+            scores[start:start + block.shape[0]] = (block - mean) @ components.T
+
+    return scores
+
+
+def transform(matrix, result, token=None, batches=None):
+    """
+        Scores of new samples in the basis of a fitted result. They are preprocessed like the fitted matrix, with
+        its column statistics rather than their own, so that both share one coordinate system. batches yields
+        (first_row, rows) and defaults to blocks of matrix.
+    """
+
+    if matrix.shape[1] != result.components.shape[1]:
+        raise ValueError("the matrix has {} features but the basis was fitted on {}".format(
+            matrix.shape[1], result.components.shape[1]))
+
+    if is_sparse(matrix):
+        from ViewPCA import sparse
+
+        return sparse.transform(matrix, result, token)
+
+    if batches is None:
+        batches = blocks(matrix)
+
+    # the precision of the basis applies to the projected samples too
+    dtype = result.settings.dtype(matrix.dtype)
+    components = result.components.astype(dtype, copy=False)
+    mean = result.mean.astype(dtype, copy=False)
+
+    scores = np.empty((matrix.shape[0], components.shape[0]), dtype=dtype)
+
+    with instrument.stage("transform"):
+        for start, block in batches:
+            if token is not None:
+                token.check()
+
+            block = preprocess_block(block, result.settings, result.offset, result.divisor)
+
+            scores[start:start + block.shape[0]] = (block - mean) @ components.T
+
+    return scores
+
+
+def fit(matrix, n_components=2, solver="auto", oversampling=10, power_iterations="auto", random_state=0, copy=True):
+    if solver not in SOLVERS:
+        raise ValueError("unknown solver: {}".format(solver))
+
+    if solver == "auto":
+        solver = choose_solver(matrix.shape, n_components)
+    elif solver == "covariance_eigh" and not HAS_COVARIANCE_EIGH:
+        solver = "full"
+
+    options = {}
+
+    if solver == "randomized":
+        options = dict(n_oversamples=oversampling, iterated_power=power_iterations, random_state=random_state)
+    elif solver == "arpack":
+        options = dict(random_state=random_state)
+
+    from sklearn.decomposition import PCA
+
+    # copy=False lets the pca center the matrix in place. Only for buffers that nobody else reads
+    pca = PCA(n_components=n_components, whiten=False, svd_solver=solver, copy=copy, **options)
+
+    # fit_transform reuses the decomposition. Calling fit before it would compute it twice
+    with instrument.stage("fit"):
+        scores = pca.fit_transform(matrix)
+
+    return Result(pca, scores, solver=solver)
+
+
+def run(matrix, settings, n_components=2, token=None, **solver_options):
+    if is_sparse(matrix):
+        from ViewPCA import sparse
+
+        return sparse.fit(matrix, settings, n_components=n_components, token=token, **solver_options)
+
+    if settings.method == "none" and not needs_cast(matrix, settings):
+        # the pca makes its own working copy
+        return fit(matrix, n_components=n_components, **solver_options).set_preprocessing(settings)
+
+    offset, divisor = column_transform(matrix, settings, token)
+
+    matrix = preprocess(matrix, settings, token=token, columns=(offset, divisor))
+
+    result = fit(matrix, n_components=n_components, copy=False, **solver_options)
+
+    return result.set_preprocessing(settings, offset, divisor)
+
+
+def compare_precision(matrix, settings, n_components=2, **solver_options):
+    """
+        Fits the matrix in float32 and in float64 and returns how far the single precision result is from the double
+        precision one: the largest principal angle between the two bases (degrees), the largest score difference
+        relative to the range of the component and the largest difference of the explained variance ratios.
+    """
+
+    results = {}
+
+    for precision in ("float32", "float64"):
+        results[precision] = run(matrix, Settings(settings.method, settings.axis, settings.norm, precision),
+                                 n_components=n_components, **solver_options)
+
+    single, double = results["float32"], results["float64"]
+
+    from scipy.linalg import subspace_angles
+
+    # computed from the sines. The arccos of cosines close to 1 would not resolve angles this small
+    angle = np.degrees(subspace_angles(single.components.T.astype(np.float64), double.components.T).max())
+
+    # the sign of each component is arbitrary
+    signs = np.sign(np.einsum("ij,ij->j", single.scores.astype(np.float64), double.scores))
+    signs[signs == 0] = 1.0
+
+    difference = np.abs(single.scores * signs - double.scores).max(axis=0)
+    spread = np.ptp(double.scores, axis=0)
+    spread[spread == 0] = 1.0
+
+    return {"subspace_angle": float(angle), "score_error": float((difference / spread).max()),
+            "variance_ratio_error": float(np.abs(single.explained_variance_ratio -
+                                                 double.explained_variance_ratio).max())}
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+# json lines log with one record per job. VIEWPCA_LOG sets the file, an empty value turns it off
+LOG_PATH = os.path.expanduser(os.environ.get("VIEWPCA_LOG", os.path.join("~", ".cache", "viewpca", "jobs.jsonl")))
+
+# VIEWPCA_PROFILE=1 captures a cProfile and the tracemalloc allocations of every job
+PROFILE = os.environ.get("VIEWPCA_PROFILE") == "1"
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+# tracemalloc is process wide: resetting its peak for one job would reset it for any other. One job is profiled at a
+# time and the others run without a profile
+_profile_lock = threading.Lock()
+
+
+def peak_rss():
+    """
+        Peak resident set size of the process since it started, in bytes, None where it is not available. It is a
+        high-water mark of the whole process, not of one job or stage.
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return "{0:.0f} {1}".format(n, unit)
+
+        n /= 1024
+
+    return "{0:.1f} GiB".format(n)
+
+
+class Recorder:
+    """
+        Wall time and process cpu time of the stages of one job, with the peak memory of the process at the end of
+        each. Stages are opened with stage(name) from any function running while the recorder is active in the
+        thread, so the engine modules mark their steps without knowing about the recorder. With profile the job also
+        runs under cProfile and tracemalloc, which measure its own allocations, unless another job is being
+        profiled.
+    """
+
+    def __init__(self, job, profile=PROFILE, **info):
+        self.job = job
+        self.info = info
+        self.profile = profile
+        self.stages = []
+        self.open_stages = []
+        self.created = time.perf_counter()
+        self.profiler = None
+        self.profiling = False  # holds the profile lock
+        self.tracing = False  # tracemalloc was started for this job
+
+    @contextlib.contextmanager
+    def activate(self):
+        previous = getattr(_local, "recorder", None)
+
+        _local.recorder = self
+
+        if self.profile and not self.profiling:
+            self.profile = False  # tried once, the later activations of the job follow the first
+
+            if _profile_lock.acquire(blocking=False):
+                self.profiling = True
+                self.profiler = cProfile.Profile()
+
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+
+                    self.tracing = True
+            else:
+                self.info["profile_skipped"] = "another job was being profiled"
+
+        if self.profiler is not None:
+            self.profiler.enable()  # only follows the thread it is enabled in
+
+        try:
+            yield self
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+
+            _local.recorder = previous
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        entry = {"stage": name, "depth": len(self.open_stages), "start": time.perf_counter() - self.created}
+
+        tracing = self.profiling and tracemalloc.is_tracing()
+
+        if tracing:
+            entry["traced"] = tracemalloc.get_traced_memory()[0]
+            entry["allocated"] = 0
+
+            tracemalloc.reset_peak()
+
+        self.stages.append(entry)
+        self.open_stages.append(entry)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+
+        try:
+            yield
+        finally:
+            entry["wall"] = time.perf_counter() - wall
+            entry["cpu"] = time.process_time() - cpu
+            entry["process_peak_rss"] = peak_rss()
+
+            self.open_stages.pop()
+
+            if tracing and tracemalloc.is_tracing():
+                # the peak was reset by the inner stages. Theirs are carried up to the enclosing ones
+                traced = entry.pop("traced")
+
+                entry["allocated"] = max(entry["allocated"], tracemalloc.get_traced_memory()[1] - traced)
+
+                if self.open_stages and "traced" in self.open_stages[-1]:
+                    parent = self.open_stages[-1]
+                    parent["allocated"] = max(parent["allocated"], entry["allocated"] + traced - parent["traced"])
+
+    def finish(self, status="ok", **info):
+        """
+            Closes the record of the job, writes it to the log and returns it.
+        """
+
+        record = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "job": self.job, "status": status,
+                  "wall": time.perf_counter() - self.created, "process_peak_rss": peak_rss(), "stages": self.stages}
+
+        record.update(self.info)
+        record.update(info)
+
+        if self.profiler is not None:
+            record["profile"] = self.dump_profile()
+
+        if self.tracing:
+            tracemalloc.stop()
+
+            self.tracing = False
+
+        if self.profiling:
+            self.profiling = False
+
+            _profile_lock.release()
+
+        write_log(record)
+
+        return record
+
+    def dump_profile(self):
+        directory = os.path.dirname(LOG_PATH) if LOG_PATH else os.getcwd()
+        path = os.path.join(directory, "{}-{}.prof".format(self.job, datetime.datetime.now().strftime("%Y%m%d-%H%M%S")))
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            self.profiler.dump_stats(path)
+        except OSError as e:
+            print("could not save the profile: {}".format(e))
+
+            return None
+
+        return path
+
+    def summary(self):
+        """
+            Outermost stages and the peak memory of the process in one line, for the tables.
+        """
+
+        parts = ["{0} {1:.2f} s".format(s["stage"], s["wall"]) for s in self.stages if s["depth"] == 0 and "wall" in s]
+
+        rss = peak_rss()
+
+        if rss is not None:
+            parts.append("process peak {}".format(format_bytes(rss)))
+
+        return "{}: {}".format(self.job, ", ".join(parts))
+
+    def details(self):
+        lines = []
+
+        for s in self.stages:
+            if "wall" not in s:
+                continue
+
+            line = "{0}{1}: {2:.3f} s wall, {3:.3f} s cpu".format("    " * s["depth"], s["stage"], s["wall"], s["cpu"])
+
+            if "allocated" in s:
+                line += ", {} allocated".format(format_bytes(s["allocated"]))
+
+            lines.append(line)
+
+        return "\n".join(lines)
+
+
+def current():
+    return getattr(_local, "recorder", None)
+
+
+def stage(name):
+    """
+        Marks a step of the job running in this thread. Nothing is recorded when no recorder is active.
+    """
+
+    recorder = current()
+
+    if recorder is None:
+        return contextlib.nullcontext()
+
+    return recorder.stage(name)
+
+
+def write_log(record):
+    if not LOG_PATH:
+        return
+
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+
+            with open(LOG_PATH, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        print("could not write the job log: {}".format(e))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class LabelArray:
+    """
+        Sample names packed in one utf-8 buffer with the offset of each name, the layout of an arrow string array.
+        A name costs its bytes plus an 8 byte offset instead of a python str object, and it is decoded only when
+        its row is shown or its point hovered.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = np.asarray(offsets, dtype=np.int64)  # n + 1 offsets, name i is data[offsets[i]:offsets[i + 1]]
+        self.data = np.asarray(data, dtype=np.uint8)
+
+    @classmethod
+    def from_lengths(cls, lengths, data):
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+
+        np.cumsum(lengths, out=offsets[1:])
+
+        return cls(offsets, data)
+
+    @classmethod
+    def from_strings(cls, values):
+        # str, bytes or anything else, which is named after its str()
+        encoded = [v if isinstance(v, bytes) else str(v).encode("utf-8") for v in values]
+
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+
+        return cls.from_lengths(lengths, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    @classmethod
+    def from_fixed(cls, values):
+        """
+            Names of a fixed width numpy bytes array, packed without going through python objects. The null padding
+            of each name is dropped.
+        """
+
+        values = np.ascontiguousarray(values).ravel()
+        width = values.dtype.itemsize
+
+        lengths = np.char.str_len(values).astype(np.int64)
+
+        if width == 0:
+            return cls.from_lengths(lengths, np.array([], dtype=np.uint8))
+
+        used = np.arange(width) < lengths[:, np.newaxis]
+
+        return cls.from_lengths(lengths, values.view(np.uint8).reshape(-1, width)[used])
+
+    @classmethod
+    def from_array(cls, values):
+        """
+            Names of a numpy array as h5py and pyarrow return them: fixed width bytes or unicode, or objects.
+        """
+
+        values = np.asarray(values)
+
+        if values.dtype.kind == "S":
+            return cls.from_fixed(values)
+
+        if values.dtype.kind == "U":
+            return cls.from_fixed(np.char.encode(values, "utf-8"))
+
+        return cls.from_strings(values.ravel())
+
+    @classmethod
+    def row_names(cls, n_rows, first=0):
+        # files without labels name the samples after their row
+        return cls.from_fixed(np.arange(first, first + n_rows).astype(bytes))
+
+    @classmethod
+    def concatenate(cls, parts):
+        parts = list(parts)
+
+        if not parts:
+            return cls([0], [])
+
+        lengths = np.concatenate([np.diff(part.offsets) for part in parts])
+        data = np.concatenate([part.data[part.offsets[0]:part.offsets[-1]] for part in parts])
+
+        return cls.from_lengths(lengths, data)
+
+    def __len__(self):
+        return self.offsets.size - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.decode(key)
+
+        return self.take(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.decode(i)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.data.nbytes
+
+    def to_fixed(self):
+        # fixed width bytes, which numpy sorts and compares without python objects
+        lengths = np.diff(self.offsets)
+        width = max(1, int(lengths.max(initial=0)))
+
+        fixed = np.zeros((len(self), width), dtype=np.uint8)
+        fixed[np.arange(width) < lengths[:, np.newaxis]] = self.data[self.offsets[0]:self.offsets[-1]]
+
+        return fixed.view("S{}".format(width)).ravel()
+
+    def decode(self, i):
+        if i < 0:
+            i += len(self)
+
+        start, stop = self.offsets[i], self.offsets[i + 1]
+
+        return bytes(self.data[start:stop]).decode("utf-8", "replace")
+
+    def take(self, key):
+        """
+            New LabelArray with the names selected by key: a slice, integer indices or a boolean mask. The bytes are
+            gathered in one vectorized copy.
+        """
+
+        index = np.arange(len(self))[key]
+
+        starts = self.offsets[index]
+        lengths = self.offsets[index + 1] - starts
+
+        result = LabelArray.from_lengths(lengths, np.array([], dtype=np.uint8))
+
+        # position in data of every byte of the new buffer
+        positions = np.repeat(starts - result.offsets[:-1], lengths) + np.arange(result.offsets[-1])
+
+        result.data = self.data[positions]
+
+        return result
+
+    def delete(self, index):
+        keep = np.ones(len(self), dtype=bool)
+        keep[index] = False
+
+        return self.take(keep)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import os
+import time
+
+import numpy as np
+
+from ViewPCA import columnar
+from ViewPCA.labelarray import LabelArray
+
+FILE_FILTER = "Matrix (*.hdf5 *.h5 *.npy);; Table (*.csv *.tsv *.parquet *.pq *.arrow *.feather *.ipc);; *.* (*.*)"
+
+LABELS = "pca_sample_labels"
+
+# hdf5 keeps attributes in the object header, which is limited to 64 KiB. Larger label sets are written as a dataset
+MAX_ATTRIBUTE_BYTES = 60000
+
+# header bytes of each element of a variable length string attribute, on top of its text
+VLEN_ELEMENT_BYTES = 16
+
+# names read at once from a label dataset
+LABEL_BLOCK = 65536
+
+
+class Progress:
+    """
+        Bytes read and chunks decoded by a load, reported to callback(stage, done, total, chunks) at most every
+        interval seconds and at the end of each stage. The token is checked after every chunk so that a load can be
+        cancelled between two reads.
+    """
+
+    def __init__(self, callback=None, token=None, interval=0.1):
+        self.callback = callback
+        self.token = token
+        self.interval = interval
+
+        self.stage = ""
+        self.total = 0
+        self.done = 0
+        self.chunks = 0
+        self.last = 0.0
+
+    def start(self, stage, total):
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.chunks = 0
+
+        self.report(True)
+
+    def advance(self, nbytes, chunks=1):
+        self.done += nbytes
+        self.chunks += chunks
+
+        self.check()
+
+        self.report(self.done >= self.total)
+
+    def check(self):
+        if self.token is not None:
+            self.token.check()
+
+    def report(self, force=False):
+        now = time.monotonic()
+
+        if self.callback is None or (not force and now - self.last < self.interval):
+            return
+
+        self.last = now
+
+        self.callback(self.stage, self.done, self.total, self.chunks)
+
+
+def extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def open_hdf5(path, mode="r"):
+    # h5py is imported with the first file opened. The window is shown without it
+    import h5py
+
+    return h5py.File(path, mode)
+
+
+def is_group(node):
+    import h5py
+
+    return isinstance(node, h5py.Group)
+
+
+def matrix_node(f, path):
+    if "pca_matrix" not in f.keys():
+        raise KeyError("{} has no pca_matrix dataset".format(path))
+
+    return f["pca_matrix"]
+
+
+def node_shape(node):
+    # a sparse matrix is a group. Its shape is an attribute
+    if is_group(node):
+        return tuple(int(n) for n in node.attrs["shape"])
+
+    return node.shape
+
+
+def read_rows(dset, out, progress):
+    """
+        Reads the dataset into out in blocks of whole hdf5 chunks, about streaming.DEFAULT_BATCH_BYTES each.
+    """
+
+    from ViewPCA import streaming
+
+    n_rows = dset.shape[0]
+    step = max(1, streaming.batch_rows(dset))
+    row_bytes = dset.nbytes // max(1, n_rows)
+
+    for start in range(0, n_rows, step):
+        stop = min(start + step, n_rows)
+
+        dset.read_direct(out, np.s_[start:stop], np.s_[start:stop])
+
+        progress.advance((stop - start) * row_bytes)
+
+    return out
+
+
+def load_csr(group, progress=None):
+    """
+        Sparse matrix stored as a pca_matrix group with the data, indices and indptr datasets of its CSR form and a
+        shape attribute, the layout scipy.sparse and anndata use.
+    """
+
+    from scipy import sparse
+
+    if progress is None:
+        progress = Progress()
+
+    names = ("data", "indices", "indptr")
+
+    for name in names:
+        if name not in group:
+            raise KeyError("the sparse pca_matrix has no {} dataset".format(name))
+
+    progress.start("reading", sum(group[name].nbytes for name in names))
+
+    data, indices, indptr = (read_rows(group[name], np.empty(group[name].shape, group[name].dtype), progress)
+                             for name in names)
+
+    return sparse.csr_matrix((data, indices, indptr), shape=node_shape(group))
+
+
+def hdf5_offset(f, dset):
+    """
+        Position of the dataset in the file when it is stored as one contiguous block that numpy can map directly.
+        None when the data is chunked, compressed, not allocated or not in a plain file.
+    """
+
+    if f.driver not in ("sec2", "stdio") or dset.chunks is not None or dset.external:
+        return None
+
+    if dset.dtype.kind not in "biuf" or dset.size == 0:
+        return None
+
+    return dset.id.get_offset()
+
+
+def read_labels(f, node, progress=None):
+    """
+        LabelArray with the sample names: a pca_sample_labels dataset at the root of the file, read in blocks of
+        LABEL_BLOCK names, or else the pca_sample_labels attribute of the matrix.
+    """
+
+    if LABELS in f and not is_group(f[LABELS]):
+        dset = f[LABELS]
+        parts = []
+
+        for start in range(0, dset.shape[0], LABEL_BLOCK):
+            parts.append(LabelArray.from_array(dset[start:start + LABEL_BLOCK]))
+
+            if progress is not None:
+                progress.check()
+
+        return LabelArray.concatenate(parts)
+
+    if LABELS not in node.attrs:
+        raise KeyError("{} has no {} attribute or dataset".format(f.filename, LABELS))
+
+    return LabelArray.from_array(node.attrs[LABELS])
+
+
+def write_labels(f, node, labels):
+    """
+        Stores the names as the pca_sample_labels attribute of node when they fit in one, else as a dataset.
+    """
+
+    import h5py
+
+    labels = labels if isinstance(labels, LabelArray) else LabelArray.from_strings(labels)
+
+    if len(labels) * VLEN_ELEMENT_BYTES + labels.data.nbytes <= MAX_ATTRIBUTE_BYTES:
+        try:
+            node.attrs[LABELS] = np.array(list(labels), dtype=h5py.string_dtype())
+
+            return
+        except OSError:
+            pass  # the object header is full after all, with the other attributes of node
+
+    dset = f.create_dataset(LABELS, (len(labels),), dtype=h5py.string_dtype())
+
+    for start in range(0, len(labels), LABEL_BLOCK):
+        dset[start:start + LABEL_BLOCK] = np.array(list(labels[start:start + LABEL_BLOCK]), dtype=object)
+
+
+def default_allocate(shape, dtype):
+    return np.empty(shape, dtype=dtype)
+
+
+def load_hdf5(path, allocate=default_allocate, progress=None):
+    if progress is None:
+        progress = Progress()
+
+    with open_hdf5(path) as f:
+        dset = matrix_node(f, path)
+        labels = read_labels(f, dset, progress)
+
+        if is_group(dset):
+            return load_csr(dset, progress), labels
+
+        offset = hdf5_offset(f, dset)
+
+        if offset is not None:
+            # nothing is read now. The pages are loaded by the fit
+            progress.start("mapping", dset.nbytes)
+            progress.advance(dset.nbytes)
+
+            return np.memmap(path, dtype=dset.dtype, mode="r", offset=offset, shape=dset.shape), labels
+
+        matrix = allocate(dset.shape, dset.dtype)
+
+        progress.start("reading", dset.nbytes)
+
+        if dset.size > 0:
+            read_rows(dset, matrix, progress)
+
+        return matrix, labels
+
+
+def load_hdf5_labels(path, progress=None):
+    with open_hdf5(path) as f:
+        return read_labels(f, matrix_node(f, path), progress)
+
+
+def load_npy(path, allocate=default_allocate, progress=None):
+    # npy files have no labels. The samples are named after their row
+
+    matrix = np.load(path, mmap_mode="r")
+
+    if progress is not None:
+        progress.start("mapping", matrix.nbytes)
+        progress.advance(matrix.nbytes)
+
+    return matrix, LabelArray.row_names(matrix.shape[0])
+
+
+def load(path, allocate=default_allocate, progress=None):
+    """
+        Returns (matrix, labels). The matrix is a read only np.memmap whenever the file layout allows it. Otherwise
+        it is read block by block into the array returned by allocate(shape, dtype), reporting to the Progress
+        progress. Sparse matrices are returned as a scipy.sparse.csr_matrix.
+    """
+
+    if extension(path) == ".npy":
+        return load_npy(path, allocate, progress)
+
+    if extension(path) in columnar.EXTENSIONS:
+        return columnar.load(path, allocate, progress)
+
+    return load_hdf5(path, allocate, progress)
+
+
+def load_shape(path):
+    if extension(path) == ".npy":
+        return np.load(path, mmap_mode="r").shape
+
+    if extension(path) in columnar.EXTENSIONS:
+        return columnar.open_source(path).shape
+
+    with open_hdf5(path) as f:
+        return node_shape(matrix_node(f, path))
+
+
+def is_sparse(path):
+    if extension(path) == ".npy" or extension(path) in columnar.EXTENSIONS:
+        return False
+
+    with open_hdf5(path) as f:
+        return is_group(matrix_node(f, path))
+
+
+def load_labels(path, progress=None):
+    if extension(path) == ".npy":
+        return load_npy(path)[1]
+
+    if extension(path) in columnar.EXTENSIONS:
+        return columnar.open_source(path, progress).labels(progress)
+
+    return load_hdf5_labels(path, progress)
+
+
+@contextlib.contextmanager
+def open_matrix(path, progress=None):
+    """
+        The matrix of path without reading it, for the passes that go through it in batches: a memmap, an hdf5
+        dataset (a group for sparse matrices) or a columnar source. Only the scan of a csv file reports progress.
+    """
+
+    if extension(path) == ".npy":
+        yield np.load(path, mmap_mode="r")
+    elif extension(path) in columnar.EXTENSIONS:
+        yield columnar.open_source(path, progress)
+    else:
+        with open_hdf5(path) as f:
+            yield matrix_node(f, path)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# below this number of visible points everything is drawn
+LOD_THRESHOLD = 20000
+
+# side of the screen cells, in pixels. Only one point is drawn per cell
+CELL_PIXELS = 2
+
+
+def representatives(x, y, x_range, y_range, width, height, cell_pixels=CELL_PIXELS, threshold=LOD_THRESHOLD):
+    """
+        Indices of the points that are drawn for the given axis ranges and plot area size in pixels. Points outside
+        of the ranges are left out and, when too many remain, the plot area is divided in a grid of cells and
+        one point of each occupied cell represents the others. Zooming in makes the cells smaller in data units,
+        so the full points come back.
+    """
+
+    x_min, x_max = x_range
+    y_min, y_max = y_range
+
+    visible = np.flatnonzero((x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max))
+
+    if visible.size <= threshold or x_max <= x_min or y_max <= y_min:
+        return visible
+
+    nx = max(1, int(width // cell_pixels))
+    ny = max(1, int(height // cell_pixels))
+
+    ix = ((x[visible] - x_min) * (nx / (x_max - x_min))).astype(np.int64)
+    iy = ((y[visible] - y_min) * (ny / (y_max - y_min))).astype(np.int64)
+
+    np.clip(ix, 0, nx - 1, out=ix)
+    np.clip(iy, 0, ny - 1, out=iy)
+
+    # every point writes its position into its cell. Any of the writes that land in the same cell is a valid
+    # representative, so there is no need to sort
+
+    cells = np.full(nx * ny, -1, dtype=np.int64)
+
+    cells[iy * nx + ix] = np.arange(visible.size)
+
+    return visible[np.sort(cells[cells >= 0])]
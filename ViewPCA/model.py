@@ -1,25 +1,53 @@
 # -*- coding: utf-8 -*-
 
+import collections
+
 import numpy as np
 from PySide2.QtCore import QAbstractTableModel, QModelIndex, Qt
-from PySide2.QtGui import QColor
+
+from ViewPCA.labelarray import LabelArray
+
+# rows formatted together when the view asks for one of them, and number of such blocks kept
+BLOCK_ROWS = 256
+MAX_BLOCKS = 64
 
 
 class Model(QAbstractTableModel):
+    """
+        Names and scores of the samples. The arrays are in the order of the fit. The view shows them through rows,
+        the positions of the samples in sort order that pass the range filter, both computed from argsort arrays.
+    """
+
     def __init__(self):
         QAbstractTableModel.__init__(self)
 
         self.ncols = 3
         nrows = 1  # initial number of rows
 
-        self.data_name = np.empty(nrows, dtype="object")
-        self.data_name[0] = "sample name"
+        # packed names, decoded only for the rows the view asks for
+        self.data_name = LabelArray.from_strings(["sample name"] * nrows)
+
+        # scores of every computed component. The two columns shown are views of it
+        self.scores = np.zeros((nrows, 2))
+        self.components = (0, 1)
+
+        self.data_pc1 = self.scores[:, 0]
+        self.data_pc2 = self.scores[:, 1]
+
+        # row of each sample in the matrix the pca was fitted on
+        self.data_index = np.arange(nrows)
+
+        self.sort_column = -1  # -1 keeps the order of the fit
+        self.sort_order = Qt.AscendingOrder
+        self.range_filter = None  # (column, low, high), either bound None when open
+
+        self.orders = {}  # argsort of a column, by the name or component it holds
+        self.blocks = collections.OrderedDict()  # formatted cells of BLOCK_ROWS rows, by block number
 
-        self.data_pc1 = np.zeros(nrows)
-        self.data_pc2 = np.zeros(nrows)
+        self.rows = np.arange(nrows)
 
     def rowCount(self, parent=QModelIndex()):
-        return self.data_name.size
+        return self.rows.size
 
     def columnCount(self, parent=QModelIndex()):
         return self.ncols
@@ -32,40 +60,206 @@ class Model(QAbstractTableModel):
             return None
 
         if orientation == Qt.Horizontal:
-            return ("Name", "PC1", "PC2")[section]
+            return ("Name", "PC{}".format(self.components[0] + 1), "PC{}".format(self.components[1] + 1))[section]
 
-        return "{}".format(section)
+        # the row of the sample in the matrix, which follows it when the table is sorted
+        return "{}".format(self.data_index[self.rows[section]])
 
     def data(self, index, role):
-        if role == Qt.BackgroundRole:
-            return QColor(Qt.white)
-
-        elif role == Qt.TextAlignmentRole:
+        if role == Qt.TextAlignmentRole:
             return Qt.AlignRight
 
         elif role == Qt.DisplayRole:
-            column = index.column()
             row = index.row()
 
-            if column == 0:
-                return self.data_name[row]
+            return self.block(row // BLOCK_ROWS)[index.column()][row % BLOCK_ROWS]
+
+    def block(self, number):
+        """
+            Text of the cells of one block of rows, formatted together the first time the view shows one of them.
+            Only the blocks scrolled through recently are kept.
+        """
+
+        if number in self.blocks:
+            self.blocks.move_to_end(number)
+
+            return self.blocks[number]
+
+        rows = self.rows[number * BLOCK_ROWS:(number + 1) * BLOCK_ROWS]
+
+        cells = (list(self.data_name[rows]),
+                 ["{0:.6e}".format(v) for v in self.data_pc1[rows]],
+                 ["{0:.6e}".format(v) for v in self.data_pc2[rows]])
+
+        self.blocks[number] = cells
+
+        if len(self.blocks) > MAX_BLOCKS:
+            self.blocks.popitem(last=False)
+
+        return cells
+
+    def n_components(self):
+        return self.scores.shape[1]
+
+    def set_data(self, labels, index, scores):
+        self.data_name = labels
+        self.data_index = index
+        self.orders = {}
+
+        self.set_scores(scores)
+
+    def set_scores(self, scores):
+        self.scores = scores
+        self.orders = {key: order for key, order in self.orders.items() if key == "name"}
+
+        self.set_axes(*self.components)
+
+    def set_axes(self, pc_x, pc_y):
+        """
+            Shows the components pc_x and pc_y (0 based) in the PC columns. Both are slices of the stored scores, so
+            nothing is refitted. Components that were not computed fall back to the last one.
+        """
+
+        last = self.n_components() - 1
+
+        self.components = (min(pc_x, last), min(pc_y, last))
+
+        self.data_pc1 = self.scores[:, self.components[0]]
+        self.data_pc2 = self.scores[:, self.components[1]]
+
+        self.update_rows()
+
+    def uses_components(self):
+        # the rows depend on the plotted components when they are sorted or filtered on a PC column
+        return self.sort_column > 0 or self.range_filter is not None
+
+    def column_key(self, column):
+        return "name" if column == 0 else self.components[column - 1]
+
+    def column_order(self, column):
+        """
+            Positions of the samples sorted by column, computed once per column content. Names are compared as
+            utf-8 bytes.
+        """
+
+        key = self.column_key(column)
+
+        if key not in self.orders:
+            values = self.data_name.to_fixed() if column == 0 else self.scores[:, key]
+
+            self.orders[key] = np.argsort(values, kind="stable")
 
-            if column == 1:
-                return "{0:.6e}".format(self.data_pc1[row])
+        return self.orders[key]
 
-            if column == 2:
-                return "{0:.6e}".format(self.data_pc2[row])
+    def update_rows(self):
+        if self.sort_column < 0:
+            rows = np.arange(self.data_index.size)
+        else:
+            rows = self.column_order(self.sort_column)
+
+            if self.sort_order == Qt.DescendingOrder:
+                rows = rows[::-1]
+
+        if self.range_filter is not None:
+            column, low, high = self.range_filter
+
+            order = self.column_order(column)
+            values = self.scores[order, self.column_key(column)]
+
+            # the samples in the range are a slice of the sorted column
+            first = np.searchsorted(values, low, side="left") if low is not None else 0
+            last = np.searchsorted(values, high, side="right") if high is not None else values.size
+
+            inside = np.zeros(self.data_index.size, dtype=bool)
+            inside[order[first:last]] = True
+
+            rows = rows[inside[rows]]
+
+        self.rows = rows
+        self.blocks.clear()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.beginResetModel()
+
+        self.sort_column = column
+        self.sort_order = order
+
+        self.update_rows()
+
+        self.endResetModel()
+
+    def set_range_filter(self, column, low=None, high=None):
+        """
+            Shows only the samples whose PC column (1 or 2) is in [low, high]. None for both bounds shows all.
+        """
+
+        self.beginResetModel()
+
+        self.range_filter = (column, low, high) if low is not None or high is not None else None
+
+        self.update_rows()
+
+        self.endResetModel()
+
+    def source_rows(self, rows):
+        # positions in the data arrays of rows of the view
+        return self.rows[rows]
 
     def remove_rows(self, index_list):
-        index_list.sort(reverse=True)
+        index_list = np.unique(np.asarray(index_list, dtype=np.int64))
+
+        if index_list.size == 0:
+            return
+
+        # consecutive rows are removed together. Each begin/endRemoveRows pair makes the views relayout
+
+        breaks = np.flatnonzero(np.diff(index_list) != 1) + 1
+        firsts = index_list[np.concatenate(([0], breaks))]
+        lasts = index_list[np.concatenate((breaks - 1, [index_list.size - 1]))]
+
+        if firsts.size > 1:
+            self.beginResetModel()
+
+            self.delete_rows(index_list)
+
+            self.endResetModel()
+        else:
+            self.beginRemoveRows(QModelIndex(), int(firsts[0]), int(lasts[0]))
+
+            self.delete_rows(index_list)
 
-        for index in index_list:
-            self.beginRemoveRows(QModelIndex(), index, index)
             self.endRemoveRows()
 
-        self.data_name = np.delete(self.data_name, index_list)
-        self.data_pc1 = np.delete(self.data_pc1, index_list)
-        self.data_pc2 = np.delete(self.data_pc2, index_list)
+    def delete_rows(self, index_list):
+        """
+            Removes rows of the view. The sorted orders are kept: the positions left are only shifted down, so no
+            argsort is computed again.
+        """
+
+        removed = np.zeros(self.data_index.size, dtype=bool)
+        removed[self.rows[index_list]] = True
+
+        shift = np.cumsum(removed)
+
+        def remaining(order):
+            order = order[~removed[order]]
+
+            return order - shift[order]
+
+        self.orders = {key: remaining(order) for key, order in self.orders.items()}
+        self.rows = remaining(self.rows)
+        self.blocks.clear()
+
+        self.data_name = self.data_name.delete(removed)
+        self.scores = self.scores[~removed]
+        self.data_index = self.data_index[~removed]
+
+        self.data_pc1 = self.scores[:, self.components[0]]
+        self.data_pc2 = self.scores[:, self.components[1]]
 
     def get_min_max_xy(self):
+        # None once every sample was removed
+        if self.scores.shape[0] == 0:
+            return None
+
         return np.amin(self.data_pc1), np.amax(self.data_pc1), np.amin(self.data_pc2), np.amax(self.data_pc2)
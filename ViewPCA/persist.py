@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import threading
+import types
+
+import numpy as np
+
+from ViewPCA import engine, instrument, loaders, streaming
+
+# bumped whenever the layout of the stored results changes. Older groups are discarded
+FORMAT_VERSION = 1
+
+GROUP = "viewpca_results"
+
+SIDECAR_SUFFIX = ".viewpca.h5"
+
+# VIEWPCA_PERSIST=0 turns the fitted results files off
+ENABLED = os.environ.get("VIEWPCA_PERSIST", "1") != "0"
+
+# one process can not open an hdf5 file twice for writing. The tables of the GUI save from their own threads
+_lock = threading.Lock()
+
+# digests already computed, by (path, size, modification time)
+_hashes = {}
+
+
+def enabled():
+    return ENABLED
+
+
+def sidecar_path(path):
+    """
+        The results are kept next to the matrix instead of inside it. Writing to the matrix file would change its
+        modification time and could move the data under a memory map.
+    """
+
+    return path + SIDECAR_SUFFIX
+
+
+def content_hash(path, token=None):
+    """
+        Digest of the shape, type and values of the matrix, read in the same batches as the streaming fit.
+    """
+
+    key = (os.path.abspath(path),) + file_stat(path)
+
+    if key not in _hashes:
+        with instrument.stage("content_hash"):
+            _hashes[key] = compute_hash(path, token)
+
+    return _hashes[key]
+
+
+def compute_hash(path, token=None):
+    digest = hashlib.blake2b(digest_size=16)
+
+    def update(matrix):
+        digest.update("{}{}".format(matrix.shape, matrix.dtype.str).encode("utf-8"))
+
+        for _, batch in streaming.row_batches(matrix):
+            if token is not None:
+                token.check()
+
+            digest.update(np.ascontiguousarray(batch).data)
+
+    with loaders.open_matrix(path) as node:
+        if loaders.is_group(node):
+            digest.update(str(loaders.node_shape(node)).encode("utf-8"))
+
+            for name in ("data", "indices", "indptr"):
+                update(node[name])
+        else:
+            update(node)
+
+    return digest.hexdigest()
+
+
+def entry_name(settings, n_components):
+    return "{}_k{}".format("_".join(settings.key()), n_components)
+
+
+def file_stat(path):
+    stat = os.stat(path)
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def matches(group, path, token=None):
+    """
+        True when the stored results belong to the current contents of path. While the size and modification
+        time are the ones recorded with the results the stored hash is trusted, so that reopening does not read
+        the matrix. Otherwise the hash is computed again and the stored time is refreshed when it still matches.
+    """
+
+    if group.attrs.get("version") != FORMAT_VERSION:
+        return False
+
+    size, mtime_ns = file_stat(path)
+
+    if group.attrs.get("file_size") == size and group.attrs.get("file_mtime_ns") == mtime_ns:
+        return True
+
+    if group.attrs.get("content_hash") != content_hash(path, token):
+        return False
+
+    if group.file.mode == "r+":  # a read only results file is checked again next time
+        group.attrs["file_size"] = size
+        group.attrs["file_mtime_ns"] = mtime_ns
+
+    return True
+
+
+def open_sidecar(sidecar):
+    try:
+        return loaders.open_hdf5(sidecar, "a")
+    except OSError:
+        return loaders.open_hdf5(sidecar)
+
+
+def load(path, settings, n_components, token=None):
+    """
+        Fitted result stored for these settings, or None when there is none or the matrix changed since.
+    """
+
+    sidecar = sidecar_path(path)
+
+    if not os.path.exists(sidecar):
+        return None
+
+    with _lock, open_sidecar(sidecar) as f:
+        if GROUP not in f or not matches(f[GROUP], path, token):
+            return None
+
+        name = entry_name(settings, n_components)
+
+        if name not in f[GROUP]:
+            return None
+
+        entry = f[GROUP][name]
+
+        fitted = types.SimpleNamespace(**{key + "_": entry[key][()] for key in (
+            "components", "mean", "explained_variance", "explained_variance_ratio", "singular_values")})
+
+        offset = entry["offset"][()] if "offset" in entry else None
+        divisor = entry["divisor"][()] if "divisor" in entry else None
+
+        solver = entry.attrs["solver"]
+
+        if solver == "None":
+            solver = streaming.SOLVER  # streamed fits stored before they had a solver name
+
+        return engine.Result(fitted, entry["scores"][()], solver=solver, settings=settings, offset=offset,
+                             divisor=divisor)
+
+
+def save(path, settings, n_components, result, token=None):
+    with _lock, loaders.open_hdf5(sidecar_path(path), "a") as f:
+        if GROUP in f and not matches(f[GROUP], path, token):
+            del f[GROUP]  # results of an older version of the file
+
+        if GROUP not in f:
+            group = f.create_group(GROUP)
+
+            size, mtime_ns = file_stat(path)
+
+            group.attrs["version"] = FORMAT_VERSION
+            group.attrs["source"] = os.path.basename(path)
+            group.attrs["content_hash"] = content_hash(path, token)
+            group.attrs["file_size"] = size
+            group.attrs["file_mtime_ns"] = mtime_ns
+
+        group = f[GROUP]
+        name = entry_name(settings, n_components)
+
+        if name in group:
+            del group[name]
+
+        entry = group.create_group(name)
+
+        entry.attrs["method"] = settings.method
+        entry.attrs["axis"] = settings.axis
+        entry.attrs["norm"] = settings.norm
+        entry.attrs["precision"] = settings.precision
+        entry.attrs["solver"] = str(result.solver)
+
+        entry.create_dataset("components", data=result.components)
+        entry.create_dataset("mean", data=result.mean)
+        entry.create_dataset("explained_variance", data=result.explained_variance)
+        entry.create_dataset("explained_variance_ratio", data=result.explained_variance_ratio)
+        entry.create_dataset("singular_values", data=result.singular_values)
+        entry.create_dataset("scores", data=result.scores, chunks=True)
+
+        if result.offset is not None:
+            entry.create_dataset("offset", data=result.offset)
+
+        if result.divisor is not None:
+            entry.create_dataset("divisor", data=result.divisor)
+
+
+def fetch(path, settings, n_components, compute, token=None):
+    """
+        Stored result when there is one, compute() otherwise. Computed results are stored for the next time the
+        file is opened. A results file that can not be read or written only costs the fit.
+    """
+
+    try:
+        with instrument.stage("load_stored"):
+            result = load(path, settings, n_components, token)
+    except (OSError, KeyError) as e:
+        print("could not read the stored results: {}".format(e))
+
+        result = None
+
+    if result is not None:
+        return result
+
+    result = compute()
+
+    try:
+        with instrument.stage("store"):
+            save(path, settings, n_components, result, token)
+    except OSError as e:
+        print("could not store the results: {}".format(e))
+
+    return result
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+from PySide2.QtCharts import QtCharts
+from PySide2.QtCore import QPointF, Qt
+
+from ViewPCA import lod
+
+# series with more points than this are drawn with OpenGL. VIEWPCA_OPENGL=0 or 1 forces it off or on
+OPENGL_THRESHOLD = 10000
+
+
+def use_opengl(n_points):
+    forced = os.environ.get("VIEWPCA_OPENGL")
+
+    if forced is not None:
+        return forced == "1"
+
+    return n_points > OPENGL_THRESHOLD
+
+
+def replace_points(series, x, y):
+    """
+        Replaces all points of the series in one call. Appending them one by one, or through a model mapper, makes
+        the chart update once per point.
+    """
+
+    points = [QPointF(a, b) for a, b in zip(x.tolist(), y.tolist())]
+
+    series.setUseOpenGL(use_opengl(len(points)))
+    series.replace(points)
+
+
+def axis_ranges(series):
+    axes = series.attachedAxes()
+
+    horizontal = [a for a in axes if a.orientation() == Qt.Horizontal]
+    vertical = [a for a in axes if a.orientation() == Qt.Vertical]
+
+    if not horizontal or not vertical:
+        return None
+
+    return (horizontal[0].min(), horizontal[0].max()), (vertical[0].min(), vertical[0].max())
+
+
+def pixel_size(series, chart):
+    """
+        Size of one screen pixel in data units along each axis.
+    """
+
+    ranges = axis_ranges(series)
+    plot_area = chart.plotArea()
+
+    if ranges is None or plot_area.width() <= 0 or plot_area.height() <= 0:
+        return None
+
+    (x_min, x_max), (y_min, y_max) = ranges
+
+    return (x_max - x_min) / plot_area.width(), (y_max - y_min) / plot_area.height()
+
+
+def replace_points_lod(series, chart, x, y):
+    """
+        Draws only the points that are visible in the current axes ranges, one per group of pixels.
+    """
+
+    ranges = axis_ranges(series)
+
+    if ranges is None or x.size <= lod.LOD_THRESHOLD:
+        replace_points(series, x, y)
+
+        return
+
+    plot_area = chart.plotArea()
+
+    idx = lod.representatives(x, y, ranges[0], ranges[1], plot_area.width(), plot_area.height())
+
+    replace_points(series, x[idx], y[idx])
+
+
+def scree_chart(spectra):
+    """
+        Chart of the explained variance ratio of each component. spectra is a list of (name, ratios) with one entry
+        per table.
+    """
+
+    chart = QtCharts.QChart()
+    chart.setTheme(QtCharts.QChart.ChartThemeLight)
+
+    axis_x = QtCharts.QValueAxis()
+    axis_x.setTitleText("Component")
+    axis_x.setLabelFormat("%d")
+
+    axis_y = QtCharts.QValueAxis()
+    axis_y.setTitleText("Explained variance (%)")
+    axis_y.setLabelFormat("%.1f")
+
+    chart.addAxis(axis_x, Qt.AlignBottom)
+    chart.addAxis(axis_y, Qt.AlignLeft)
+
+    n_components = 1
+    y_max = 1.0
+
+    for name, ratios in spectra:
+        if len(ratios) == 0:
+            continue
+
+        percent = 100 * np.asarray(ratios)
+
+        series = QtCharts.QLineSeries()
+        series.setName(name)
+        series.setPointsVisible(True)
+        series.replace([QPointF(n + 1, p) for n, p in enumerate(percent.tolist())])
+
+        chart.addSeries(series)
+
+        series.attachAxis(axis_x)
+        series.attachAxis(axis_y)
+
+        n_components = max(n_components, percent.size)
+        y_max = max(y_max, percent.max())
+
+    axis_x.setRange(1, max(n_components, 2))
+    axis_x.setTickCount(min(max(n_components, 2), 11))
+    axis_y.setRange(0, 1.05 * y_max)
+
+    return chart
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from PySide2.QtCharts import QtCharts
+from PySide2.QtCore import QBuffer, QByteArray, QIODevice
+from PySide2.QtUiTools import QUiLoader
+
+UI_PATH = os.path.join(os.path.dirname(__file__), "ui")
+
+_loader = None
+_templates = {}
+_stylesheets = {}
+
+
+def loader():
+    """
+        One QUiLoader for the whole application. Creating it looks up the designer plugins, which costs more than
+        building the widgets.
+    """
+
+    global _loader
+
+    if _loader is None:
+        _loader = QUiLoader()
+        _loader.registerCustomWidget(QtCharts.QChartView)
+
+    return _loader
+
+
+def template(name):
+    # the .ui files are read from disk once
+    if name not in _templates:
+        with open(os.path.join(UI_PATH, name), "rb") as f:
+            _templates[name] = QByteArray(f.read())
+
+    return _templates[name]
+
+
+def load_ui(name, parent=None):
+    """
+        New widget tree built from the cached designer file.
+    """
+
+    buffer = QBuffer()
+    buffer.setData(template(name))
+    buffer.open(QIODevice.ReadOnly)
+
+    widget = loader().load(buffer, parent)
+
+    buffer.close()
+
+    return widget
+
+
+def stylesheet(name):
+    if name not in _stylesheets:
+        with open(os.path.join(UI_PATH, name), encoding="utf-8") as f:
+            _stylesheets[name] = f.read()
+
+    return _stylesheets[name]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from PySide2.QtCore import QObject, QTimer, Signal
+
+from ViewPCA import engine
+
+
+class Scheduler(QObject):
+    """
+        Runs one job at a time in a worker thread. Requests arriving within `delay` milliseconds of each other are
+        merged into the last one and a running job is cancelled as soon as a newer request is submitted. Results
+        are delivered in the thread that owns the scheduler, usually the GUI thread.
+    """
+
+    started = Signal()
+    finished = Signal(object,)
+    failed = Signal(object,)
+    discarded = Signal(object,)  # result of a job cancelled after it completed
+    idle = Signal()
+
+    # emitted from the worker thread. Qt queues it to the thread of the scheduler
+    done = Signal(object,)
+
+    def __init__(self, delay=150, parent=None):
+        QObject.__init__(self, parent)
+
+        self.pending = None
+        self.token = None
+        self.running = False
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+
+        self.timer.timeout.connect(self.launch)
+        self.done.connect(self.on_done)
+
+    def submit(self, job):
+        """
+            job is called as job(token) in the worker thread. It should call token.check() between expensive steps.
+        """
+
+        self.pending = job
+
+        if self.token is not None:
+            self.token.cancel()
+
+        self.timer.start()
+
+    def cancel(self):
+        self.pending = None
+
+        self.timer.stop()
+
+        if self.token is not None:
+            self.token.cancel()
+
+    def busy(self):
+        # a job is running or waiting for the delay to expire
+        return self.running or self.pending is not None
+
+    def launch(self):
+        if self.running or self.pending is None:
+            return
+
+        job, self.pending = self.pending, None
+
+        self.token = engine.CancelToken()
+        self.running = True
+
+        self.started.emit()
+
+        t = threading.Thread(target=self.work, args=(job, self.token), daemon=True)
+        t.start()
+
+    def work(self, job, token):
+        try:
+            self.done.emit((token, job(token), None))
+        except engine.Cancelled:
+            self.done.emit((token, None, None))
+        except Exception as e:
+            self.done.emit((token, None, e))
+
+    def on_done(self, payload):
+        token, result, error = payload
+
+        self.running = False
+
+        if not token.cancelled():
+            if error is not None:
+                self.failed.emit(error)
+            else:
+                self.finished.emit(result)
+        elif result is not None:
+            self.discarded.emit(result)
+
+        if self.pending is None:
+            self.idle.emit()
+        elif not self.timer.isActive():
+            self.launch()
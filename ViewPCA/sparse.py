@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from ViewPCA import engine, instrument, stats
+
+# up to this number of features the d x d covariance is formed from the sparse product and decomposed, like the
+# covariance_eigh solver does for dense matrices. Wider matrices are decomposed by arpack
+MAX_GRAM_FEATURES = 2000
+
+SOLVERS = ("auto", "covariance_eigh", "arpack")
+
+
+def row_statistics(matrix, settings):
+    """
+        (row_scale, row_offset) of the preprocessing along the samples axis: row i becomes
+        (x_i - row_offset[i]) * row_scale[i]. row_offset is None when the rows are only scaled.
+    """
+
+    n_cols = matrix.shape[1]
+
+    if settings.method == "normalize":
+        if settings.norm == "l1":
+            norms = abs(matrix).sum(axis=1, dtype=np.float64)
+        elif settings.norm == "l2":
+            norms = np.sqrt(matrix.multiply(matrix).sum(axis=1, dtype=np.float64))
+        else:
+            norms = abs(matrix).max(axis=1).toarray()
+
+        norms = np.asarray(norms, dtype=np.float64).ravel()
+
+        norms[norms == 0.0] = 1.0
+
+        return 1.0 / norms, None
+
+    # the implicit zeros count in the mean and the standard deviation of each row
+    mean = np.asarray(matrix.sum(axis=1, dtype=np.float64)).ravel() / n_cols
+    square = np.asarray(matrix.multiply(matrix).sum(axis=1, dtype=np.float64)).ravel() / n_cols
+
+    std = np.sqrt(np.clip(square - np.square(mean), 0.0, None))
+
+    std[std == 0.0] = 1.0
+
+    return 1.0 / std, mean
+
+
+def column_statistics(matrix, settings):
+    """
+        (offset, divisor) along the features axis, the same ones engine.column_statistics computes for a dense
+        matrix. They come from sums over the stored values only.
+    """
+
+    n_rows = matrix.shape[0]
+
+    if settings.method == "normalize":
+        if settings.norm == "l1":
+            norms = abs(matrix).sum(axis=0, dtype=np.float64)
+        elif settings.norm == "l2":
+            norms = np.sqrt(matrix.multiply(matrix).sum(axis=0, dtype=np.float64))
+        else:
+            norms = abs(matrix).max(axis=0).toarray()
+
+        norms = np.asarray(norms, dtype=np.float64).ravel()
+
+        norms[norms == 0.0] = 1.0
+
+        return None, norms
+
+    mean = np.asarray(matrix.sum(axis=0, dtype=np.float64)).ravel() / max(n_rows, 1)
+    square = np.asarray(matrix.multiply(matrix).sum(axis=0, dtype=np.float64)).ravel() / max(n_rows, 1)
+
+    std = np.sqrt(np.clip(square - np.square(mean), 0.0, None))
+
+    std[std == 0.0] = 1.0
+
+    return mean, std
+
+
+def column_transform(matrix, settings):
+    if settings.method != "none" and settings.axis == "features":
+        with instrument.stage("column_statistics"):
+            return column_statistics(matrix, settings)
+
+    return None, None
+
+
+class Preprocessed:
+    """
+        The preprocessed and centered matrix, applied to vectors without being formed. Every preprocessing is a
+        scaling of the rows and columns of the sparse matrix minus a rank one term,
+
+            diag(row_scale) X diag(col_scale) - a b^T - 1 mean^T
+
+        so only the scaled copy of the stored values is kept. Subtracting the offsets and the mean from X itself
+        would make it dense.
+    """
+
+    def __init__(self, matrix, settings, columns=None, mean=None):
+        n_rows, n_cols = matrix.shape
+
+        self.shape = matrix.shape
+        self.dtype = settings.dtype(matrix.dtype)
+
+        row_scale, col_scale = None, None
+        self.a, self.b = None, None
+
+        if settings.method != "none" and settings.axis == "samples":
+            row_scale, row_offset = row_statistics(matrix, settings)
+
+            if row_offset is not None:
+                self.a = row_scale * row_offset
+                self.b = np.ones(n_cols)
+        elif settings.method != "none":
+            offset, divisor = columns if columns is not None else column_statistics(matrix, settings)
+
+            col_scale = 1.0 / divisor
+
+            if offset is not None:
+                self.a = np.ones(n_rows)
+                self.b = offset * col_scale
+
+        matrix = matrix.tocsr()
+
+        data = matrix.data.astype(np.float64)
+
+        if row_scale is not None:
+            data *= np.repeat(row_scale, np.diff(matrix.indptr))
+
+        if col_scale is not None:
+            data *= col_scale[matrix.indices]
+
+        self.scaled = matrix.__class__((data.astype(self.dtype), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+        # column means of the preprocessed matrix, or the mean of the basis the samples are projected onto
+        self.mean = self.uncentered_rmatmat(np.ones((n_rows, 1), dtype=np.float64)).ravel() / max(n_rows, 1) \
+            if mean is None else np.asarray(mean, dtype=np.float64)
+
+    def uncentered_matmat(self, v):
+        product = self.scaled @ v
+
+        if self.a is not None:
+            product -= np.outer(self.a, self.b @ v)
+
+        return product
+
+    def uncentered_rmatmat(self, u):
+        product = self.scaled.T @ u
+
+        if self.a is not None:
+            product -= np.outer(self.b, self.a @ u)
+
+        return product
+
+    def matmat(self, v, token=None):
+        if token is not None:
+            token.check()
+
+        v = np.asarray(v).reshape(self.shape[1], -1)
+
+        return (self.uncentered_matmat(v) - (self.mean @ v)[np.newaxis, :]).astype(self.dtype, copy=False)
+
+    def rmatmat(self, u, token=None):
+        if token is not None:
+            token.check()
+
+        u = np.asarray(u).reshape(self.shape[0], -1)
+
+        return (self.uncentered_rmatmat(u) - np.outer(self.mean, u.sum(axis=0))).astype(self.dtype, copy=False)
+
+    def linear_operator(self, token=None):
+        from scipy.sparse.linalg import LinearOperator
+
+        return LinearOperator(self.shape, dtype=self.dtype,
+                              matvec=lambda v: self.matmat(v, token).ravel(),
+                              rmatvec=lambda u: self.rmatmat(u, token).ravel(),
+                              matmat=lambda v: self.matmat(v, token),
+                              rmatmat=lambda u: self.rmatmat(u, token))
+
+    def moments(self):
+        """
+            stats.Moments of the preprocessed matrix. The Gram matrix comes from the sparse product plus the rank
+            one corrections, in float64.
+        """
+
+        n_rows = self.shape[0]
+
+        scaled = self.scaled.astype(np.float64)
+
+        gram = (scaled.T @ scaled).toarray()
+        total = self.uncentered_rmatmat(np.ones((n_rows, 1))).ravel()
+
+        if self.a is not None:
+            cross = scaled.T @ self.a
+
+            gram -= np.outer(cross, self.b) + np.outer(self.b, cross)
+            gram += (self.a @ self.a) * np.outer(self.b, self.b)
+
+        return stats.Moments(n_rows, total, gram, np.zeros(self.shape[1]))
+
+    def total_variance(self):
+        # squared frobenius norm of the centered matrix, from the stored values and the rank one term
+        n_rows = self.shape[0]
+
+        square = float(np.square(self.scaled.data, dtype=np.float64).sum())
+
+        if self.a is not None:
+            square += -2.0 * float(self.a @ (self.scaled @ self.b)) + float(self.a @ self.a) * float(self.b @ self.b)
+
+        return (square - n_rows * float(self.mean @ self.mean)) / max(n_rows - 1, 1)
+
+
+def choose_solver(shape, solver="auto"):
+    if solver == "auto":
+        return "covariance_eigh" if shape[1] <= MAX_GRAM_FEATURES else "arpack"
+
+    # the dense solvers would need the centered matrix in memory
+    return solver if solver in SOLVERS else "arpack"
+
+
+def decompose_arpack(operator, n_components, token=None):
+    from scipy.sparse.linalg import svds
+
+    n_rows, n_cols = operator.shape
+
+    # arpack finds fewer singular vectors than the smallest dimension
+    k = max(1, min(n_components, min(operator.shape) - 1))
+
+    # fixed start vector so that refits give the same signs and the same scores
+    v0 = np.random.default_rng(0).uniform(-1.0, 1.0, min(operator.shape)).astype(operator.dtype)
+
+    _, singular_values, vt = svds(operator.linear_operator(token), k=k, v0=v0)
+
+    order = np.argsort(singular_values)[::-1]
+
+    components = stats.flip_signs(np.array(vt[order], dtype=np.float64))
+    explained_variance = np.square(singular_values[order].astype(np.float64)) / max(n_rows - 1, 1)
+
+    return stats.Decomposition(components, operator.mean, explained_variance, operator.total_variance(), n_rows)
+
+
+def fit(matrix, settings, n_components=2, solver="auto", token=None, columns=None, **solver_options):
+    """
+        Pca of a scipy.sparse matrix. The preprocessing and the centering stay implicit, so the memory follows the
+        number of stored values instead of n x d. solver_options of the dense solvers are ignored.
+    """
+
+    if columns is None:
+        columns = column_transform(matrix, settings)
+
+    solver = choose_solver(matrix.shape, solver)
+
+    with instrument.stage("preprocess"):
+        operator = Preprocessed(matrix, settings, columns)
+
+    with instrument.stage("fit"):
+        if solver == "covariance_eigh":
+            decomposition = operator.moments().decompose(n_components)
+        else:
+            decomposition = decompose_arpack(operator, n_components, token)
+
+    with instrument.stage("project"):
+        scores = operator.matmat(decomposition.components_.T.astype(operator.dtype), token)
+
+    offset, divisor = columns
+
+    return engine.Result(decomposition, scores, solver="sparse_" + solver, settings=settings, offset=offset,
+                         divisor=divisor)
+
+
+def transform(matrix, result, token=None):
+    """
+        Scores of sparse samples in the basis of a fitted result, centered with its mean.
+    """
+
+    operator = Preprocessed(matrix, result.settings, (result.offset, result.divisor), mean=result.mean)
+
+    with instrument.stage("transform"):
+        return operator.matmat(result.components.T.astype(operator.dtype), token)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# hover tolerance around a point
+TOLERANCE_PIXELS = 2.0
+
+# the tree is rebuilt at the pixel size of the chart when a pixel is more than this many times wider than tall in
+# its units, or taller than wide. It bounds the candidates of the ball around the ellipse of the tolerance
+MAX_PIXEL_ASPECT = 2.0
+
+
+def extent(values):
+    spread = float(np.ptp(values)) if values.size > 0 else 0.0
+
+    return spread if spread > 0.0 else 1.0
+
+
+class PointIndex:
+    """
+        KD-tree over the projected coordinates, each axis divided by a scale so that a pixel of the chart is about as
+        wide as it is tall in the tree. It is built once per fit with the extent of the points as the scale, which
+        is what the chart shows after a fit, and answers hover queries in O(log n). A zoom that stretches one axis
+        much more than the other rebuilds it with the size of a pixel as the scale.
+    """
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self.size = x.size
+        self.scale = (extent(x), extent(y))
+        self.tree = None
+
+        if self.size > 0:
+            self.build(*self.scale)
+
+    def build(self, scale_x, scale_y):
+        from scipy.spatial import cKDTree
+
+        self.scale = (scale_x, scale_y)
+        self.tree = cKDTree(np.column_stack((self.x / scale_x, self.y / scale_y)))
+
+    def nearest(self, x, y, pixel_width, pixel_height, tolerance=TOLERANCE_PIXELS):
+        """
+            Indices of the points closest to (x, y) in screen distance, among those less than tolerance pixels
+            away. Points drawn on top of each other are all returned. pixel_width and pixel_height are the size of
+            one pixel in data units along each axis.
+        """
+
+        if self.tree is None or pixel_width <= 0 or pixel_height <= 0:
+            return np.array([], dtype=np.int64)
+
+        # size of a pixel in the units of the tree
+        width, height = pixel_width / self.scale[0], pixel_height / self.scale[1]
+
+        if max(width, height) > MAX_PIXEL_ASPECT * min(width, height):
+            self.build(pixel_width, pixel_height)
+
+            width, height = 1.0, 1.0
+
+        x, y = x / self.scale[0], y / self.scale[1]
+
+        # the ball contains the ellipse of the pixel tolerance
+        candidates = np.asarray(self.tree.query_ball_point((x, y), tolerance * max(width, height)), dtype=np.int64)
+
+        if candidates.size == 0:
+            return candidates
+
+        points = self.tree.data[candidates]
+
+        distance = np.hypot((points[:, 0] - x) / width, (points[:, 1] - y) / height)
+
+        inside = distance <= tolerance
+
+        candidates, distance = candidates[inside], distance[inside]
+
+        if candidates.size == 0:
+            return candidates
+
+        # ties are points less than half a pixel apart from the closest one
+        return np.sort(candidates[distance <= distance.min() + 0.5])
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from ViewPCA import engine, instrument
+
+# above this number of features the d x d matrices cost more than refitting the samples directly
+MAX_MOMENT_FEATURES = 4096
+
+
+class Decomposition:
+    """
+        Holds the same attributes as a fitted sklearn PCA so that it can be wrapped in an engine.Result.
+    """
+
+    def __init__(self, components, mean, explained_variance, total_variance, n_samples):
+        self.components_ = components
+        self.mean_ = mean
+        self.explained_variance_ = explained_variance
+        self.explained_variance_ratio_ = explained_variance / total_variance if total_variance > 0 else \
+            np.zeros_like(explained_variance)
+        self.singular_values_ = np.sqrt(explained_variance * max(n_samples - 1, 0))
+
+
+def flip_signs(components):
+    # same sign convention as sklearn: the largest loading of each component is positive
+    signs = np.sign(components[np.arange(components.shape[0]), np.argmax(np.abs(components), axis=1)])
+    signs[signs == 0] = 1.0
+
+    components *= signs[:, np.newaxis]
+
+    return components
+
+
+class Moments:
+    """
+        Sample count, column sums and Gram matrix (X^T X) of a matrix. The covariance, and from it the pca, follows
+        from them without another pass over the samples. Removing samples only subtracts their contribution.
+
+        The sums are taken around shift, an estimate of the mean, so that the covariance does not come from the
+        difference of two large numbers.
+    """
+
+    def __init__(self, n_samples, total, gram, shift):
+        self.n_samples = n_samples
+        self.total = total
+        self.gram = gram
+        self.shift = shift
+
+    @classmethod
+    def empty(cls, n_cols):
+        return cls(0, np.zeros(n_cols), np.zeros((n_cols, n_cols)), None)
+
+    @classmethod
+    def from_matrix(cls, matrix, token=None):
+        moments = cls.empty(matrix.shape[1])
+
+        with instrument.stage("moments"):
+            for _, block in engine.blocks(matrix):
+                if token is not None:
+                    token.check()
+
+                moments.add(block)
+
+        if moments.shift is None:
+            moments.shift = np.zeros(matrix.shape[1])
+
+        return moments
+
+    def add(self, block):
+        if self.shift is None:
+            self.shift = block.mean(axis=0, dtype=np.float64)
+
+        centered = block - self.shift
+
+        self.n_samples += block.shape[0]
+        self.total += centered.sum(axis=0)
+        self.gram += centered.T @ centered
+
+    def downdate(self, rows):
+        """
+            Moments of the matrix without the given rows (a 2d array with the removed samples).
+        """
+
+        rows = np.asarray(rows, dtype=np.float64) - self.shift
+
+        return Moments(self.n_samples - rows.shape[0], self.total - rows.sum(axis=0), self.gram - rows.T @ rows,
+                       self.shift)
+
+    def mean(self):
+        return self.shift + self.total / self.n_samples
+
+    def covariance(self):
+        centered_mean = self.total / self.n_samples
+
+        # the sample covariance, with n - 1 like sklearn uses for explained_variance_
+        return (self.gram - self.n_samples * np.outer(centered_mean, centered_mean)) / max(self.n_samples - 1, 1)
+
+    def decompose(self, n_components):
+        covariance = self.covariance()
+
+        with instrument.stage("decompose"):
+            eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+
+        # eigh returns them in ascending order
+        order = np.argsort(eigenvalues)[::-1][:n_components]
+
+        components = flip_signs(eigenvectors[:, order].T)
+
+        explained_variance = np.clip(eigenvalues[order], 0.0, None)
+
+        return Decomposition(components, self.mean(), explained_variance, np.trace(covariance), self.n_samples)
+
+
+class Statistics(Moments):
+    """
+        Moments of the raw matrix plus the column norms. They are gathered in one pass when a matrix is loaded. Any
+        preprocessing that only shifts and scales the columns (none, normalize or standardize along the features)
+        is applied to them directly, so switching between those settings costs an eigendecomposition of a d x d
+        matrix and the projection of the samples.
+    """
+
+    def __init__(self, n_samples, total, gram, shift, abs_total, abs_max):
+        Moments.__init__(self, n_samples, total, gram, shift)
+
+        self.abs_total = abs_total
+        self.abs_max = abs_max
+
+    @classmethod
+    def empty(cls, n_cols):
+        return cls(0, np.zeros(n_cols), np.zeros((n_cols, n_cols)), None, np.zeros(n_cols), np.zeros(n_cols))
+
+    def add(self, block):
+        Moments.add(self, block)
+
+        absolute = np.abs(block)
+
+        self.abs_total += absolute.sum(axis=0)
+        np.maximum(self.abs_max, absolute.max(axis=0), out=self.abs_max)
+
+    def downdate(self, matrix, removed, kept):
+        """
+            Statistics of the kept rows of matrix, whose statistics these are. Sums are subtracted. A column maximum
+            is only searched again among the kept rows when a removed row reached it.
+        """
+
+        rows = np.asarray(matrix[removed])
+        moments = Moments.downdate(self, rows)
+
+        absolute = np.abs(rows)
+
+        abs_max = self.abs_max.copy()
+        reached = np.flatnonzero(absolute.max(axis=0, initial=0.0) >= abs_max)
+
+        if reached.size > 0:
+            abs_max[reached] = np.abs(np.asarray(matrix[np.ix_(kept, reached)])).max(axis=0, initial=0.0)
+
+        return Statistics(moments.n_samples, moments.total, moments.gram, moments.shift,
+                          self.abs_total - absolute.sum(axis=0), abs_max)
+
+    def square_total(self):
+        # sum of x^2 per column, undoing the shift
+        return np.diag(self.gram) + 2.0 * self.shift * self.total + self.n_samples * np.square(self.shift)
+
+    def column_transform(self, settings):
+        """
+            (offset, divisor) such that the preprocessed matrix is (X - offset) / divisor.
+        """
+
+        n_cols = self.total.size
+
+        if settings.method == "none":
+            return np.zeros(n_cols), np.ones(n_cols)
+
+        if settings.method == "standardize":
+            centered_mean = self.total / self.n_samples
+            variance = np.diag(self.gram) / self.n_samples - np.square(centered_mean)
+            divisor = np.sqrt(np.clip(variance, 0.0, None))
+            offset = self.mean()
+        elif settings.norm == "l1":
+            divisor, offset = self.abs_total.copy(), np.zeros(n_cols)
+        elif settings.norm == "l2":
+            divisor, offset = np.sqrt(np.clip(self.square_total(), 0.0, None)), np.zeros(n_cols)
+        else:
+            divisor, offset = self.abs_max.copy(), np.zeros(n_cols)
+
+        divisor[divisor == 0.0] = 1.0
+
+        return offset, divisor
+
+    def transformed(self, offset, divisor):
+        return Moments(self.n_samples, self.total / divisor, self.gram / np.outer(divisor, divisor),
+                       (self.shift - offset) / divisor)
+
+    def fit(self, matrix, settings, n_components=2, token=None):
+        offset, divisor = self.column_transform(settings)
+
+        decomposition = self.transformed(offset, divisor).decompose(n_components)
+
+        # ((x - offset) / divisor - mean) . v == (x - (offset + mean * divisor)) . (v / divisor). The statistics are
+        # float64 whatever the precision. Only the projection of the samples runs in it
+        scores = engine.project(matrix, decomposition.components_ / divisor, offset + decomposition.mean_ * divisor,
+                                token, dtype=settings.dtype(matrix.dtype))
+
+        return engine.Result(decomposition, scores, solver="statistics", settings=settings, offset=offset,
+                             divisor=divisor)
+
+    def refit(self, matrix, kept, settings, n_components=2, token=None):
+        """
+            Pca of the rows kept of the raw matrix. The column offsets and divisors are the ones of the kept rows, as
+            if they had been loaded alone.
+        """
+
+        kept = np.asarray(kept)
+        removed = np.setdiff1d(np.arange(matrix.shape[0]), kept, assume_unique=True)
+
+        result = self.downdate(matrix, removed, kept).fit(matrix, settings, n_components=n_components, token=token)
+
+        result.scores = result.scores[kept]
+        result.solver = "covariance_downdate"
+
+        return result
+
+
+def derivable(shape, settings):
+    """
+        True when the pca for these settings comes from the statistics of the raw matrix. Only for tall matrices,
+        the same ones the covariance solver is chosen for.
+    """
+
+    return (settings.method == "none" or settings.axis == "features") and engine.is_tall(shape)
+
+
+def refit(matrix, kept, n_components=2, moments=None, token=None):
+    """
+        Pca of the rows kept of matrix, which is preprocessed sample by sample or not at all. When the moments of the
+        full matrix are given the removed rows are subtracted from them instead of reading all the kept ones again.
+    """
+
+    kept = np.asarray(kept)
+
+    if moments is None:
+        moments = Moments.from_matrix(matrix[kept], token)
+    else:
+        removed = np.setdiff1d(np.arange(matrix.shape[0]), kept, assume_unique=True)
+
+        moments = moments.downdate(matrix[removed])
+
+    decomposition = moments.decompose(n_components)
+
+    # matrix is already in the working type of the preprocessing
+    scores = engine.project(matrix, decomposition.components_, decomposition.mean_, token,
+                            dtype=engine.working_dtype(matrix.dtype))[kept]
+
+    return engine.Result(decomposition, scores, solver="covariance_downdate")
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from ViewPCA import engine, instrument, loaders
+
+# datasets larger than this are not loaded in memory by the GUI. They are streamed in batches instead
+STREAMING_THRESHOLD = 2 ** 30
+
+# used when the dataset is not chunked
+DEFAULT_BATCH_BYTES = 64 * 2 ** 20
+
+
+def batch_rows(dset, batch_size=None, min_rows=1):
+    """
+        Number of rows read at once. It is always a multiple of the rows in one hdf5 chunk so that no chunk is
+        decompressed twice.
+    """
+
+    n_rows, n_cols = dset.shape[0], int(np.prod(dset.shape[1:]))
+
+    chunks = getattr(dset, "chunks", None)  # numpy arrays and memmaps have no chunks
+    chunk_rows = chunks[0] if chunks else 1
+
+    if batch_size is None:
+        batch_size = max(1, DEFAULT_BATCH_BYTES // max(1, n_cols * dset.dtype.itemsize))
+
+    batch_size = max(batch_size, min_rows)
+    batch_size = int(np.ceil(batch_size / chunk_rows)) * chunk_rows
+
+    return min(batch_size, n_rows)
+
+
+def row_batches(dset, batch_size=None, min_rows=1):
+    """
+        Yields (first_row, batch). A tail smaller than min_rows is merged into the previous batch because
+        IncrementalPCA.partial_fit needs at least n_components samples per call.
+    """
+
+    n_rows = dset.shape[0]
+    size = batch_rows(dset, batch_size, min_rows)
+
+    if hasattr(dset, "read_chunks"):
+        # columnar files are read front to back. Their blocks are cut again into batches of the same sizes
+        yield from rebatch(dset.read_chunks(), n_rows, size, min_rows)
+
+        return
+
+    start = 0
+
+    while start < n_rows:
+        stop = start + size
+
+        if n_rows - stop < min_rows:
+            stop = n_rows
+
+        yield start, dset[start:stop]
+
+        start = stop
+
+
+def rebatch(blocks, n_rows, size, min_rows=1):
+    pending = []
+    buffered = 0
+    start = 0
+
+    for block in blocks:
+        pending.append(block)
+        buffered += block.shape[0]
+
+        while start < n_rows:
+            stop = start + size
+
+            if n_rows - stop < min_rows:
+                stop = n_rows
+
+            if buffered < stop - start:
+                break
+
+            merged = np.concatenate(pending) if len(pending) > 1 else pending[0]
+
+            yield start, merged[:stop - start]
+
+            pending = [merged[stop - start:]]
+            buffered = pending[0].shape[0]
+            start = stop
+
+
+# name of the solver of the streamed fits, stored with their results like the svd solvers
+SOLVER = "incremental"
+
+
+def run(dset, settings, n_components=2, batch_size=None, token=None):
+    """
+        Two passes over the dataset (three when the preprocessing works along the features axis). Only one batch
+        is in memory at any time.
+    """
+
+    offset, divisor = None, None
+
+    if settings.method != "none" and settings.axis == "features":
+        with instrument.stage("column_statistics"):
+            offset, divisor = engine.column_statistics(row_batches(dset, batch_size), dset.shape[1], settings, token)
+
+    from sklearn.decomposition import IncrementalPCA
+
+    ipca = IncrementalPCA(n_components=n_components, whiten=False)
+
+    with instrument.stage("partial_fit"):
+        for _, batch in row_batches(dset, batch_size, min_rows=n_components):
+            if token is not None:
+                token.check()
+
+            ipca.partial_fit(engine.preprocess_block(batch, settings, offset, divisor))
+
+    scores = np.empty((dset.shape[0], n_components), dtype=settings.dtype(dset.dtype))
+
+    with instrument.stage("transform"):
+        for start, batch in row_batches(dset, batch_size):
+            if token is not None:
+                token.check()
+
+            batch = engine.preprocess_block(batch, settings, offset, divisor)
+
+            scores[start:start + batch.shape[0]] = ipca.transform(batch)
+
+    return engine.Result(ipca, scores, solver=SOLVER, settings=settings, offset=offset, divisor=divisor)
+
+
+def transform_file(path, result, batch_size=None, token=None):
+    """
+        Projects the samples of a file onto a fitted basis, one batch in memory at a time.
+    """
+
+    with loaders.open_matrix(path) as matrix:
+        return engine.transform(matrix, result, token, row_batches(matrix, batch_size))
+
+
+def needs_streaming(path, threshold=STREAMING_THRESHOLD, progress=None):
+    with loaders.open_matrix(path, progress) as node:
+        # sparse matrices are loaded whole. Their size follows the stored values
+        return not loaders.is_group(node) and node.nbytes > threshold
+
+
+def run_file(path, settings, n_components=2, batch_size=None, token=None):
+    with loaders.open_matrix(path) as node:
+        if loaders.is_group(node):
+            raise ValueError("{} holds a sparse matrix. It is fitted in memory instead of streamed".format(path))
+
+        return run(node, settings, n_components=n_components, batch_size=batch_size, token=token)
@@ -1,55 +1,85 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import os
-import threading
 
-import h5py
 import numpy as np
 from PySide2.QtCharts import QtCharts
-from PySide2.QtCore import QEvent, QObject, Qt, Signal
-from PySide2.QtGui import QColor, QGuiApplication, QKeySequence
-from PySide2.QtUiTools import QUiLoader
-from PySide2.QtWidgets import (QFileDialog, QFrame, QGraphicsDropShadowEffect,
-                               QGroupBox, QHeaderView, QLabel, QLineEdit,
-                               QProgressBar, QPushButton, QRadioButton,
-                               QTableView)
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import normalize, scale
-
+from PySide2.QtCore import QEvent, QLocale, QObject, Qt, Signal
+from PySide2.QtGui import QColor, QDoubleValidator, QGuiApplication, QKeySequence
+from PySide2.QtWidgets import (QCheckBox, QComboBox, QFileDialog, QFrame,
+                               QGraphicsDropShadowEffect, QGroupBox,
+                               QHeaderView, QLabel, QLineEdit, QProgressBar,
+                               QPushButton, QRadioButton, QTableView)
+
+from ViewPCA import (cache, engine, instrument, loaders, persist, plotting,
+                     resources, spatial, stats, streaming, workers)
 from ViewPCA.callout import Callout
+from ViewPCA.labelarray import LabelArray
 from ViewPCA.model import Model
+from ViewPCA.scheduler import Scheduler
+
+# overlapping points shown in the hover callout
+MAX_CALLOUT_LABELS = 5
+
+# principal components computed per fit. The plotted pair is picked among them without refitting
+DEFAULT_COMPONENTS = 10
+
+# a covariance needs two samples. With fewer left the removed rows are only hidden, not refitted
+MIN_REFIT_SAMPLES = 2
 
 
 class Table(QObject):
     new_mouse_coords = Signal(object,)
+    fitted = Signal()
+    basis_changed = Signal()
+
+    # (token, stage, bytes done, bytes total, chunks) of the file being loaded. Emitted from the loading thread
+    load_progress = Signal(object,)
 
     def __init__(self, chart):
         QObject.__init__(self)
 
-        self.module_path = os.path.dirname(__file__)
         self.pca_matrix = np.array([])
-        self.labels = []
+        self.labels = LabelArray.from_strings([])
+        self.file_path = ""
+        self.streaming = False
+        self.source_key = None
+        self.shared_matrix = None
+        self.point_index = None
+        self.kept = None  # rows of the matrix left after samples were removed from the table
+        self.matrix_shape = (0, 0)
+        self.n_components = DEFAULT_COMPONENTS
+        self.axes = (0, 1)  # components shown in the x and y axes, 0 based
+        self.explained_variance_ratio = np.array([])
+        self.singular_values = np.array([])
+        self.result = None  # last fitted or projected result
+        self.basis = None  # table whose fitted basis this one is projected onto, None for its own fit
+        self.basis_choices = []
+        self.load_summary = ""
+        self.job_summary = ""
 
         self.chart = chart
         self.model = Model()
-        self.model_selection = Model()
+        self.selection = np.array([], dtype=np.int64)
 
         self.callout = Callout(self.chart)
         self.callout.hide()
 
-        loader = QUiLoader()
-
-        self.main_widget = loader.load(self.module_path + "/ui/table.ui")
+        self.main_widget = resources.load_ui("table.ui")
 
         self.table_view = self.main_widget.findChild(QTableView, "table_view")
         table_cfg_frame = self.main_widget.findChild(QFrame, "table_cfg_frame")
         pc_frame = self.main_widget.findChild(QFrame, "pc_frame")
         button_load_data = self.main_widget.findChild(QPushButton, "button_load_data")
+        self.pc_x_title = self.main_widget.findChild(QLabel, "pc_x_title")
+        self.pc_y_title = self.main_widget.findChild(QLabel, "pc_y_title")
         self.pc1_variance_ratio = self.main_widget.findChild(QLabel, "pc1_variance_ratio")
         self.pc1_singular_value = self.main_widget.findChild(QLabel, "pc1_singular_value")
         self.pc2_variance_ratio = self.main_widget.findChild(QLabel, "pc2_variance_ratio")
         self.pc2_singular_value = self.main_widget.findChild(QLabel, "pc2_singular_value")
         self.legend = self.main_widget.findChild(QLineEdit, "legend_name")
+        self.groupbox_method = self.main_widget.findChild(QGroupBox, "groupbox_method")
         self.groupbox_axis = self.main_widget.findChild(QGroupBox, "groupbox_axis")
         self.groupbox_norm = self.main_widget.findChild(QGroupBox, "groupbox_norm")
         self.preprocessing_none = self.main_widget.findChild(QRadioButton, "radio_none")
@@ -61,13 +91,53 @@ class Table(QObject):
         self.preprocessing_norm_l2 = self.main_widget.findChild(QRadioButton, "radio_norm_l2")
         self.preprocessing_norm_max = self.main_widget.findChild(QRadioButton, "radio_norm_max")
         self.progressbar = self.main_widget.findChild(QProgressBar, "progressbar")
+        self.button_cancel = self.main_widget.findChild(QPushButton, "button_cancel")
+        self.refit_on_remove = self.main_widget.findChild(QCheckBox, "refit_on_remove")
+        self.combo_basis = self.main_widget.findChild(QComboBox, "combo_basis")
+        self.combo_precision = self.main_widget.findChild(QComboBox, "combo_precision")
+        self.combo_filter = self.main_widget.findChild(QComboBox, "combo_filter")
+        self.filter_min = self.main_widget.findChild(QLineEdit, "filter_min")
+        self.filter_max = self.main_widget.findChild(QLineEdit, "filter_max")
+        self.profile_jobs = self.main_widget.findChild(QCheckBox, "profile_jobs")
+        self.timing_summary = self.main_widget.findChild(QLabel, "timing_summary")
 
         self.progressbar.hide()
+        self.button_cancel.hide()
+
+        self.filter_min.setValidator(QDoubleValidator(self.filter_min))
+        self.filter_max.setValidator(QDoubleValidator(self.filter_max))
+
+        # pca jobs
+
+        self.scheduler = Scheduler(parent=self)
+
+        self.scheduler.finished.connect(self.on_pca_finished)
+        self.scheduler.failed.connect(self.on_pca_failed)
+        self.scheduler.discarded.connect(self.on_job_discarded)
+        self.scheduler.idle.connect(self.on_idle)
+
+        # file loads. They run in a thread of their own so that the window stays responsive
 
-        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.table_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.loader = Scheduler(delay=0, parent=self)
+
+        self.loader.finished.connect(self.on_load_finished)
+        self.loader.failed.connect(self.on_load_failed)
+        self.loader.discarded.connect(self.on_job_discarded)
+        self.loader.idle.connect(self.on_idle)
+
+        self.load_progress.connect(self.on_load_progress)
+
+        # ResizeToContents would measure every row of the model after each change. The columns are fitted to the
+        # rows in the viewport by fit_to_contents and all rows share the height of the first one
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.table_view.horizontalHeader().setResizeContentsPrecision(0)
+        self.table_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.table_view.setModel(self.model)
 
+        # the model sorts itself with argsort arrays. No section is sorted until a header is clicked
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_view.setSortingEnabled(True)
+
         # chart series
 
         self.series = QtCharts.QScatterSeries(self.table_view)
@@ -77,12 +147,6 @@ class Table(QObject):
 
         self.chart.addSeries(self.series)
 
-        self.mapper = QtCharts.QVXYModelMapper()
-        self.mapper.setXColumn(1)
-        self.mapper.setYColumn(2)
-        self.mapper.setSeries(self.series)
-        self.mapper.setModel(self.model)
-
         # selection series
 
         self.series_selection = QtCharts.QScatterSeries(self.table_view)
@@ -93,12 +157,6 @@ class Table(QObject):
 
         self.chart.addSeries(self.series_selection)
 
-        self.mapper_selection = QtCharts.QVXYModelMapper()
-        self.mapper_selection.setXColumn(1)
-        self.mapper_selection.setYColumn(2)
-        self.mapper_selection.setSeries(self.series_selection)
-        self.mapper_selection.setModel(self.model_selection)
-
         # effects
 
         button_load_data.setGraphicsEffect(self.button_shadow())
@@ -108,6 +166,7 @@ class Table(QObject):
         # signals
 
         button_load_data.clicked.connect(self.open_file)
+        self.button_cancel.clicked.connect(self.cancel_jobs)
         self.table_view.selectionModel().selectionChanged.connect(self.selection_changed)
         self.legend.returnPressed.connect(self.update_legend)
         self.preprocessing_none.toggled.connect(self.on_preprocessing_changed)
@@ -118,6 +177,12 @@ class Table(QObject):
         self.preprocessing_norm_l1.toggled.connect(self.on_preprocessing_norm_changed)
         self.preprocessing_norm_l2.toggled.connect(self.on_preprocessing_norm_changed)
         self.preprocessing_norm_max.toggled.connect(self.on_preprocessing_norm_changed)
+        self.combo_basis.currentIndexChanged.connect(self.on_basis_changed)
+        self.combo_precision.currentIndexChanged.connect(self.on_precision_changed)
+        self.combo_filter.currentIndexChanged.connect(self.update_filter)
+        self.filter_min.editingFinished.connect(self.update_filter)
+        self.filter_max.editingFinished.connect(self.update_filter)
+        self.model.modelReset.connect(self.on_model_reset)
 
         # event filter
 
@@ -223,166 +288,573 @@ class Table(QObject):
         s_model = self.table_view.selectionModel()
 
         if s_model.hasSelection():
-            index_list = s_model.selectedRows()
-            int_index_list = []
+            self.model.remove_rows(self.selected_rows())
+
+            self.kept = self.model.data_index.copy()
+            self.selection = np.array([], dtype=np.int64)
+
+            self.point_index = None  # rebuilt by the next hover
 
-            for index in index_list:
-                int_index_list.append(index.row())
+            self.update_series()
 
-            self.model.remove_rows(int_index_list)
+            if self.refit_on_remove.isChecked() and self.refit_on_remove.isEnabled():
+                self.do_pca()
 
     def open_file(self):
         file_path = QFileDialog.getOpenFileName(self.main_widget, "Open File", os.path.expanduser("~"),
-                                                "Matrix (*.hdf5);; *.* (*.*)")[0]
+                                                loaders.FILE_FILTER)[0]
 
         if file_path != "":
-            with h5py.File(file_path, "r") as f:
-                if "pca_matrix" in f.keys():
-                    dset = f["pca_matrix"]
+            self.load_file(file_path)
 
-                    self.pca_matrix = dset[:]
-                    self.labels = dset.attrs["pca_sample_labels"]
+    def load_file(self, file_path):
+        # a fit of the current matrix would be replaced by the fit of the new one anyway
+        self.scheduler.cancel()
 
-                    t = threading.Thread(target=self.do_pca, args=(), daemon=True)
-                    t.start()
+        self.show_progress(0)
 
-    def do_pca(self):
-        pca_matrix = np.copy(self.pca_matrix)
+        job = functools.partial(self.read_file, file_path)
+
+        self.loader.submit(functools.partial(self.run_recorded, self.recorder("load", file=file_path), job))
+
+    def read_file(self, file_path, token):
+        """
+            Reads the file in the loading thread, in chunks, reporting each one through load_progress. The table is
+            only updated by on_load_finished, so a cancelled or failed load leaves the current matrix in place.
+        """
+
+        progress = loaders.Progress(lambda *report: self.load_progress.emit((token,) + report), token)
+
+        shared_matrix = None
+
+        with instrument.stage("read"):
+            use_streaming = streaming.needs_streaming(file_path, progress=progress)
+
+            if use_streaming:
+                # the matrix is read in batches by each pca run
+                pca_matrix = np.array([])
+                labels = loaders.load_labels(file_path, progress)
+                shape = loaders.load_shape(file_path)
+            elif workers.enabled() and not loaders.is_sparse(file_path):
+                # mapped or loaded straight into shared memory. The worker processes attach to it without copies
+                shared_matrix, labels = workers.load_shared(file_path, progress)
+                pca_matrix = shared_matrix.array
+                shape = pca_matrix.shape
+            else:
+                # sparse matrices too. They are fitted in this process, with the preprocessing applied implicitly
+                pca_matrix, labels = loaders.load(file_path, progress=progress)
+                shape = pca_matrix.shape
+
+        token.check()
+
+        return file_path, use_streaming, pca_matrix, shared_matrix, labels, shape
+
+    def on_load_finished(self, payload):
+        file_path, use_streaming, pca_matrix, shared_matrix, labels, shape, recorder = payload
+
+        source_key = cache.file_key(file_path)
+
+        if self.source_key is not None and self.source_key != source_key:
+            cache.shared.discard(self.source_key)
+
+        self.file_path = file_path
+        self.source_key = source_key
+        self.streaming = use_streaming
+        self.pca_matrix = pca_matrix
+        self.shared_matrix = shared_matrix
+        self.labels = labels
+        self.matrix_shape = shape
+        self.kept = None
+
+        self.update_preprocessing_widgets()
+
+        recorder.finish(shape=list(self.matrix_shape), streaming=self.streaming)
+
+        self.load_summary = recorder.summary()
+
+        self.update_timing_summary(recorder)
+
+        self.do_pca()
+
+    def on_load_failed(self, error):
+        print("loading failed: {}".format(error))
+
+    def on_load_progress(self, report):
+        token, stage, done, total, chunks = report
+
+        if token.cancelled():
+            return  # queued before the load was cancelled or replaced by a newer one
 
-        if pca_matrix.size == 0:
+        self.progressbar.setRange(0, 1000)
+        self.progressbar.setValue(int(1000 * done / total) if total > 0 else 1000)
+        self.progressbar.setFormat("{} {} / {}, {} chunks".format(stage, instrument.format_bytes(done),
+                                                                  instrument.format_bytes(total), chunks))
+        self.progressbar.setTextVisible(True)
+
+    def show_progress(self, maximum):
+        # maximum 0 shows a busy indicator until the first progress report
+        self.progressbar.setRange(0, maximum)
+        self.progressbar.setTextVisible(False)
+        self.progressbar.show()
+
+        self.button_cancel.show()
+
+    def cancel_jobs(self):
+        self.loader.cancel()
+        self.scheduler.cancel()
+
+        # the worker threads stop at their next token check. Nothing they report until then is shown
+        self.progressbar.hide()
+        self.button_cancel.hide()
+
+    def on_job_discarded(self, payload):
+        # the job completed before it was cancelled. Its result is not shown but its record is still written
+        payload[-1].finish("superseded")
+
+    def on_idle(self):
+        if self.loader.busy() or self.scheduler.busy():
             return
 
-        if self.preprocessing_normalize.isChecked():
-            axis_type = 1  # axis = 0 for features(columns) and axis=1 for samples(rows)
-            norm_type = "l1"
+        self.progressbar.hide()
+        self.button_cancel.hide()
 
-            if self.preprocessing_axis_features.isChecked():  # features
-                axis_type = 0
+    def release(self):
+        self.loader.cancel()
+        self.scheduler.cancel()
+
+        # the shared memory segment is freed once the last job holding it is done
+        self.pca_matrix = np.array([])
+        self.shared_matrix = None
 
-            if self.preprocessing_norm_l2.isChecked():
-                norm_type = "l2"
-            elif self.preprocessing_norm_max.isChecked():
-                norm_type = "max"
+    def get_settings(self):
+        method = "none"
+        axis = "samples"
+        norm = "l1"
 
-            pca_matrix = normalize(pca_matrix, copy=False, axis=axis_type, norm=norm_type)
+        if self.preprocessing_normalize.isChecked():
+            method = "normalize"
         elif self.preprocessing_standardize.isChecked():
-            axis_type = 1
+            method = "standardize"
 
-            if self.preprocessing_axis_features.isChecked():  # features
-                axis_type = 0
+        if self.preprocessing_axis_features.isChecked():
+            axis = "features"
 
-            pca_matrix = scale(pca_matrix, copy=False, axis=axis_type)
+        if self.preprocessing_norm_l2.isChecked():
+            norm = "l2"
+        elif self.preprocessing_norm_max.isChecked():
+            norm = "max"
 
-        pca = PCA(n_components=2, whiten=False)
+        return engine.Settings(method=method, axis=axis, norm=norm, precision=self.combo_precision.currentText())
 
-        pca.fit(pca_matrix)
+    def do_pca(self):
+        if not self.streaming and self.pca_matrix.size == 0:
+            return
 
-        self.pc1_variance_ratio.setText("{0:.1f}%".format(pca.explained_variance_ratio_[0] * 100))
-        self.pc2_variance_ratio.setText("{0:.1f}%".format(pca.explained_variance_ratio_[1] * 100))
+        # everything the job needs is captured now. The widgets must not be touched from the worker thread
 
-        self.pc1_singular_value.setText("{0:.1f} ".format(pca.singular_values_[0]))
-        self.pc2_singular_value.setText("{0:.1f} ".format(pca.singular_values_[1]))
+        if self.basis is not None:
+            if self.basis.result is None:
+                return  # projected once the other table has fitted its model
 
-        reduced_cartesian = pca.fit_transform(pca_matrix)
+            if self.kept is not None and self.kept.size == 0:
+                return  # every sample was removed
 
-        self.model.beginResetModel()
+            # nothing is fitted on the samples, so the ones removed from the table stay removed
+            job = functools.partial(self.compute_projection, self.file_path, self.streaming, self.pca_matrix,
+                                    self.labels, self.kept, self.basis.result, self.axes)
 
-        self.model.data_name = np.asarray(self.labels)
-        self.model.data_pc1 = reduced_cartesian[:, 0]
-        self.model.data_pc2 = reduced_cartesian[:, 1]
+            self.submit_job(self.recorder("projection", file=self.file_path, removed=self.kept is not None), job)
 
-        self.model.endResetModel()
+            return
 
-        first_index = self.model.index(0, 0)
-        last_index = self.model.index(self.model.rowCount() - 1, self.model.columnCount() - 1)
+        kept = None
 
-        self.model.dataChanged.emit(first_index, last_index)
+        if self.kept is not None and self.refit_on_remove.isChecked() and self.refit_on_remove.isEnabled():
+            if self.kept.size < MIN_REFIT_SAMPLES:
+                return
 
-        self.progressbar.hide()
+            kept = self.kept
+        else:
+            self.kept = None  # a fit on all samples brings the removed ones back
 
-    def selection_changed(self, selected, deselected):
-        s_model = self.table_view.selectionModel()
+        settings = self.get_settings()
+        n_components = engine.clip_components(self.matrix_shape, self.n_components)
 
-        if s_model.hasSelection():
-            selection_labels = []
-            selection_pc1 = []
-            selection_pc2 = []
-            indexes = s_model.selectedRows()
+        job = functools.partial(self.compute_pca, self.source_key, self.file_path, self.streaming, self.pca_matrix,
+                                self.shared_matrix, self.labels, settings, kept, n_components, self.axes)
+
+        recorder = self.recorder("pca", file=self.file_path, settings=list(settings.key()), n_components=n_components,
+                                 refit=kept is not None)
 
-            for index in indexes:
-                row_idx = index.row()
+        self.submit_job(recorder, job)
 
-                selection_labels.append(self.model.data_name[row_idx])
-                selection_pc1.append(self.model.data_pc1[row_idx])
-                selection_pc2.append(self.model.data_pc2[row_idx])
+    def recorder(self, job, **info):
+        return instrument.Recorder(job, profile=instrument.PROFILE or self.profile_jobs.isChecked(), **info)
 
-            # update the model used to show the selected rows
+    def submit_job(self, recorder, job):
+        if not self.loader.busy():
+            self.show_progress(0)
 
-            self.model_selection.beginResetModel()
+        self.scheduler.submit(functools.partial(self.run_recorded, recorder, job))
 
-            self.model_selection.data_name = np.asarray(selection_labels)
-            self.model_selection.data_pc1 = np.asarray(selection_pc1)
-            self.model_selection.data_pc2 = np.asarray(selection_pc2)
+    def run_recorded(self, recorder, job, token):
+        """
+            Runs job in the worker thread with the recorder active. The recorder goes along with the payload so that
+            the model and chart updates of the GUI thread are added to the same record.
+        """
 
-            self.model_selection.endResetModel()
+        try:
+            with recorder.activate():
+                payload = job(token)
+        except engine.Cancelled:
+            recorder.finish("cancelled")
 
-            first_index = self.model_selection.index(0, 0)
-            last_index = self.model_selection.index(self.model_selection.rowCount() - 1,
-                                                    self.model_selection.columnCount() - 1)
+            raise
+        except Exception as e:
+            recorder.finish("failed", error=repr(e))
 
-            self.model_selection.dataChanged.emit(first_index, last_index)
+            raise
+
+        return payload + (recorder,)
+
+    def compute_pca(self, source_key, file_path, use_streaming, pca_matrix, shared_matrix, labels, settings, kept,
+                    n_components, axes, token):
+        index = np.arange(len(labels))
+
+        if kept is not None:
+            result = cache.refit(cache.shared, source_key, pca_matrix, settings, kept, n_components=n_components,
+                                 token=token)
+
+            labels = labels[kept]
+            index = kept
+        elif persist.enabled():
+            # fitted results of earlier sessions are read back from the results file next to the matrix
+            fit = functools.partial(self.fit_all_samples, source_key, file_path, use_streaming, pca_matrix,
+                                    shared_matrix, settings, n_components, token)
+
+            result = cache.shared.fetch((source_key, settings.key(), n_components, "stored"),
+                                        lambda: persist.fetch(file_path, settings, n_components, fit, token))
+        else:
+            result = self.fit_all_samples(source_key, file_path, use_streaming, pca_matrix, shared_matrix, settings,
+                                          n_components, token)
+
+        token.check()
+
+        return self.job_payload(result, labels, index, axes)
+
+    def fit_all_samples(self, source_key, file_path, use_streaming, pca_matrix, shared_matrix, settings, n_components,
+                        token):
+        if use_streaming:
+            if workers.enabled():
+                compute = functools.partial(workers.run_file, file_path, settings, n_components, token=token)
+            else:
+                compute = functools.partial(streaming.run_file, file_path, settings, n_components, token=token)
+
+            return cache.shared.fetch((source_key, settings.key(), n_components, "streaming"), compute)
+
+        if shared_matrix is not None and not stats.derivable(pca_matrix.shape, settings):
+            return cache.shared.fetch(cache.result_key(source_key, settings, n_components),
+                                      lambda: workers.run_shared(shared_matrix, settings, n_components, token=token))
+
+        token.check()
+
+        compute_statistics = None
+
+        if shared_matrix is not None:
+            # the pass over the samples runs in a worker. Only the small d x d statistics come back
+            compute_statistics = functools.partial(workers.run_statistics, shared_matrix, token=token)
+
+        return cache.run(cache.shared, source_key, pca_matrix, settings, n_components=n_components, token=token,
+                         compute_statistics=compute_statistics)
+
+    def compute_projection(self, file_path, use_streaming, pca_matrix, labels, kept, basis, axes, token):
+        """
+            Only transforms the samples with the components and mean of a model fitted by another table. That is
+            one matrix product per batch instead of a decomposition. Only the kept rows are shown.
+        """
+
+        index = np.arange(len(labels))
+
+        if use_streaming:
+            scores = streaming.transform_file(file_path, basis, token=token)
         else:
-            print("no selection")
+            scores = engine.transform(pca_matrix, basis, token)
+
+        token.check()
+
+        if kept is not None:
+            scores = scores[kept]
+            labels = labels[kept]
+            index = kept
+
+        return self.job_payload(basis.projected(scores), labels, index, axes)
+
+    def job_payload(self, result, labels, index, axes):
+        # the point index is built in the job so that the GUI thread does not pay for it
+
+        last = result.scores.shape[1] - 1
+        axes = (min(axes[0], last), min(axes[1], last))
+
+        with instrument.stage("point_index"):
+            point_index = spatial.PointIndex(result.scores[:, axes[0]], result.scores[:, axes[1]])
+
+        return result, labels, index, axes, point_index
+
+    def on_pca_finished(self, payload):
+        result, labels, index, axes, point_index, recorder = payload
+
+        self.result = result
+        self.explained_variance_ratio = result.explained_variance_ratio
+        self.singular_values = result.singular_values
+
+        with recorder.activate():
+            with instrument.stage("model_update"):
+                self.model.beginResetModel()
+
+                self.model.set_data(labels, index, result.scores)
+                self.model.set_axes(*self.axes)
+
+                self.model.endResetModel()
+
+            # the axes may have been changed while the job was running
+            self.point_index = point_index if axes == self.model.components else None
+
+            self.update_pc_labels()
+
+            self.selection = np.array([], dtype=np.int64)  # the reset cleared the selection
+
+            with instrument.stage("chart_update"):
+                self.update_series()
+
+                first_index = self.model.index(0, 0)
+                last_index = self.model.index(self.model.rowCount() - 1, self.model.columnCount() - 1)
+
+                self.model.dataChanged.emit(first_index, last_index)  # rescales the chart axes
+
+            self.fit_to_contents()
+
+        recorder.finish(solver=result.solver)
+
+        self.job_summary = recorder.summary()
+
+        self.update_timing_summary(recorder)
+
+        self.fitted.emit()
+
+    def update_timing_summary(self, recorder):
+        self.timing_summary.setText("\n".join(s for s in (self.load_summary, self.job_summary) if s))
+        self.timing_summary.setToolTip(recorder.details())
+
+    def update_pc_labels(self):
+        pc_x, pc_y = self.model.components
+
+        self.pc_x_title.setText("PC{} Axis".format(pc_x + 1))
+        self.pc_y_title.setText("PC{} Axis".format(pc_y + 1))
+
+        if self.explained_variance_ratio.size == 0:
+            return
+
+        # a projection keeps the variance and singular values of the samples the basis was fitted on
+        projected = self.result is not None and self.result.solver == "projection"
+
+        suffix = " (basis)" if projected else ""
+        tip = "Of the samples of the reference table, not of the projected ones" if projected else ""
+
+        self.pc1_variance_ratio.setText("{0:.1f}%{1}".format(self.explained_variance_ratio[pc_x] * 100, suffix))
+        self.pc2_variance_ratio.setText("{0:.1f}%{1}".format(self.explained_variance_ratio[pc_y] * 100, suffix))
+
+        self.pc1_singular_value.setText("{0:.1f}{1} ".format(self.singular_values[pc_x], suffix))
+        self.pc2_singular_value.setText("{0:.1f}{1} ".format(self.singular_values[pc_y], suffix))
+
+        for label in (self.pc1_variance_ratio, self.pc2_variance_ratio, self.pc1_singular_value,
+                      self.pc2_singular_value):
+            label.setToolTip(tip)
+
+    def set_n_components(self, n_components):
+        if n_components != self.n_components:
+            self.n_components = n_components
+
+            self.do_pca()
+
+    def set_axes(self, pc_x, pc_y):
+        """
+            Plots the components pc_x and pc_y (0 based). They are columns of the stored scores, so no refit is needed.
+        """
+
+        self.axes = (pc_x, pc_y)
+
+        if self.model.uses_components():
+            # the sorted order or the filtered rows follow the new columns
+            self.model.beginResetModel()
+            self.model.set_axes(pc_x, pc_y)
+            self.model.endResetModel()
+        else:
+            self.model.set_axes(pc_x, pc_y)
+
+        self.point_index = None  # rebuilt by the next hover
+
+        self.update_pc_labels()
+        self.update_series()
+
+        self.model.headerDataChanged.emit(Qt.Horizontal, 1, 2)
+
+        self.model.dataChanged.emit(self.model.index(0, 1), self.model.index(self.model.rowCount() - 1, 2))
+
+        self.fit_to_contents()
+
+    def fit_to_contents(self):
+        # only the rows in the viewport are measured, see the precision set on the horizontal header
+        self.table_view.resizeColumnsToContents()
+
+        if self.model.rowCount() > 0:
+            self.table_view.verticalHeader().setDefaultSectionSize(self.table_view.sizeHintForRow(0))
+
+    def update_filter(self, *args):
+        """
+            Range filter on the PC column chosen in combo_filter. An empty bound is open.
+        """
+
+        def bound(line_edit):
+            text = line_edit.text().strip()
+
+            return QLocale().toDouble(text)[0] if text else None
+
+        self.model.set_range_filter(self.combo_filter.currentIndex() + 1, bound(self.filter_min),
+                                    bound(self.filter_max))
+
+        self.fit_to_contents()
+
+    def on_model_reset(self):
+        # a fit, a sort or a filter drops the selection of the view
+        self.selection = np.array([], dtype=np.int64)
+
+        plotting.replace_points_lod(self.series_selection, self.chart, self.model.data_pc1[self.selection],
+                                    self.model.data_pc2[self.selection])
+
+    def update_series(self):
+        plotting.replace_points_lod(self.series, self.chart, self.model.data_pc1, self.model.data_pc2)
+        plotting.replace_points_lod(self.series_selection, self.chart, self.model.data_pc1[self.selection],
+                                    self.model.data_pc2[self.selection])
+
+    def on_pca_failed(self, error):
+        print("pca failed: {}".format(error))
+
+    def selected_rows(self):
+        """
+            Rows whose columns are all selected, like QItemSelectionModel.selectedRows, computed from the selection
+            ranges instead of one QModelIndex per row.
+        """
+
+        covered = np.zeros(self.model.rowCount(), dtype=np.int64)
+
+        for selection_range in self.table_view.selectionModel().selection():
+            covered[selection_range.top():selection_range.bottom() + 1] += selection_range.width()
+
+        return np.flatnonzero(covered >= self.model.columnCount())
+
+    def selection_changed(self, selected, deselected):
+        self.selection = self.model.source_rows(self.selected_rows())
+
+        plotting.replace_points_lod(self.series_selection, self.chart, self.model.data_pc1[self.selection],
+                                    self.model.data_pc2[self.selection])
 
     def update_legend(self):
         self.series.setName(self.legend.displayText())
 
+    def update_preprocessing_widgets(self):
+        # a projected table uses the preprocessing of the table that fitted the basis
+        own_fit = self.basis is None
+
+        self.groupbox_method.setEnabled(own_fit)
+        self.groupbox_axis.setEnabled(own_fit and not self.preprocessing_none.isChecked())
+        self.groupbox_norm.setEnabled(own_fit and self.preprocessing_normalize.isChecked())
+        self.combo_precision.setEnabled(own_fit)
+        self.refit_on_remove.setEnabled(own_fit and not self.streaming)
+
     def on_preprocessing_changed(self, state):
         if state:
-            if self.preprocessing_none.isChecked():
-                self.groupbox_axis.setEnabled(False)
-                self.groupbox_norm.setEnabled(False)
+            self.update_preprocessing_widgets()
+
+            self.do_pca()
+
+    def set_basis_choices(self, choices):
+        """
+            choices is a list of (name, table) with the tables this one can be projected onto. The current basis
+            falls back to the own fit when it is no longer among them.
+        """
+
+        self.basis_choices = [table for _, table in choices]
+
+        self.combo_basis.blockSignals(True)
+
+        self.combo_basis.clear()
+        self.combo_basis.addItem("own fit")
+
+        for name, _ in choices:
+            self.combo_basis.addItem("project onto " + name)
+
+        if self.basis in self.basis_choices:
+            self.combo_basis.setCurrentIndex(self.basis_choices.index(self.basis) + 1)
+
+        self.combo_basis.blockSignals(False)
 
-            elif self.preprocessing_normalize.isChecked():
-                self.groupbox_axis.setEnabled(True)
-                self.groupbox_norm.setEnabled(True)
+        if self.basis is not None and self.basis not in self.basis_choices:
+            self.set_basis(None)
 
-            elif self.preprocessing_standardize.isChecked():
-                self.groupbox_axis.setEnabled(True)
-                self.groupbox_norm.setEnabled(False)
+    def set_basis(self, basis):
+        if basis is self.basis:
+            return
+
+        if self.basis is not None:
+            self.basis.fitted.disconnect(self.do_pca)
+
+        self.basis = basis
+
+        if self.basis is not None:
+            # projected again whenever the other table refits
+            self.basis.fitted.connect(self.do_pca)
+
+        self.update_preprocessing_widgets()
 
-            self.progressbar.show()
+        self.basis_changed.emit()
 
-            t = threading.Thread(target=self.do_pca, args=(), daemon=True)
-            t.start()
+        self.do_pca()
+
+    def on_basis_changed(self, index):
+        self.set_basis(self.basis_choices[index - 1] if index > 0 else None)
 
     def on_preprocessing_axis_changed(self, state):
         if state:
-            self.progressbar.show()
-
-            t = threading.Thread(target=self.do_pca, args=(), daemon=True)
-            t.start()
+            self.do_pca()
 
     def on_preprocessing_norm_changed(self, state):
         if state:
-            self.progressbar.show()
+            self.do_pca()
 
-            t = threading.Thread(target=self.do_pca, args=(), daemon=True)
-            t.start()
+    def on_precision_changed(self, index):
+        self.do_pca()
 
     def on_hover(self, point, state):
         if state:
             self.new_mouse_coords.emit(point)
 
-            dx = np.fabs(self.model.data_pc1 - point.x())
-            dy = np.fabs(self.model.data_pc2 - point.y())
+            pixel_size = plotting.pixel_size(self.series, self.chart)
+
+            if pixel_size is None:
+                return
+
+            if self.point_index is None:
+                self.point_index = spatial.PointIndex(self.model.data_pc1, self.model.data_pc2)
+
+            idx_list = self.point_index.nearest(point.x(), point.y(), *pixel_size)
 
-            idx_list = np.argwhere((dx < 0.00001) & (dy < 0.00001))
+            if len(idx_list) > 0:
+                labels = list(self.model.data_name[idx_list[:MAX_CALLOUT_LABELS]])
 
-            if len(idx_list) == 1:
-                label = self.model.data_name[idx_list[0]][0]
+                if len(idx_list) > MAX_CALLOUT_LABELS:
+                    labels.append("(+{})".format(len(idx_list) - MAX_CALLOUT_LABELS))
 
-                self.callout.set_text(label)
+                self.callout.set_text("\n".join(labels))
                 self.callout.set_anchor(point)
                 self.callout.setZValue(11)
                 self.callout.updateGeometry()
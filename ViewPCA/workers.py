@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ViewPCA import engine, instrument, loaders, stats, streaming
+
+# number of worker processes. 0 runs the pca inside the GUI process
+MAX_WORKERS = int(os.environ.get("VIEWPCA_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def open_shared_memory(name):
+    # the spawned workers share the resource tracker of the GUI process. The segment is unlinked only by its owner
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedMatrix:
+    """
+        Matrix stored in a shared memory segment. Worker processes attach to it by name instead of receiving a
+        pickled copy.
+    """
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+        self.array = np.ndarray(self.shape, dtype=dtype, buffer=self.shm.buf)
+
+    def descriptor(self):
+        return ("shm", self.shm.name, self.shape, self.dtype.str)
+
+    def release(self):
+        if self.shm is None:
+            return
+
+        self.array = None
+
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # views of the array are still alive. The mapping goes away together with them
+
+        self.shm.unlink()
+
+        self.shm = None
+
+    def __del__(self):
+        self.release()
+
+
+class MappedMatrix:
+    """
+        Matrix mapped from its file. The workers map the same file and share the page cache with the GUI process.
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    def descriptor(self):
+        order = "F" if self.array.flags.f_contiguous and not self.array.flags.c_contiguous else "C"
+
+        return ("memmap", self.array.filename, self.array.offset, self.array.shape, self.array.dtype.str, order)
+
+    def release(self):
+        self.array = None
+
+
+def load_shared(path, progress=None):
+    """
+        Memory maps the file when its layout allows it. Otherwise the matrix is read straight into shared memory.
+    """
+
+    segments = []
+
+    def allocate(shape, dtype):
+        segments.append(SharedMatrix(shape, dtype))
+
+        return segments[-1].array
+
+    try:
+        matrix, labels = loaders.load(path, allocate, progress)
+    except BaseException:
+        # a cancelled or failed read frees its segment at once
+        for segment in segments:
+            segment.release()
+
+        raise
+
+    if segments:
+        return segments[0], labels
+
+    return MappedMatrix(matrix), labels
+
+
+def limit_threads(n_threads):
+    # each worker gets its share of the cores so that the blas libraries of the workers do not oversubscribe them
+
+    from threadpoolctl import threadpool_limits
+
+    threadpool_limits(limits=n_threads)
+
+
+def enabled():
+    return MAX_WORKERS > 0
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            n_threads = max(1, (os.cpu_count() or 1) // MAX_WORKERS)
+
+            # spawn instead of fork. Forking a process that runs Qt threads is not safe
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                                               mp_context=multiprocessing.get_context("spawn"),
+                                                               initializer=limit_threads, initargs=(n_threads,))
+
+        return _executor
+
+
+def set_max_workers(n_workers):
+    global MAX_WORKERS, _executor
+
+    with _executor_lock:
+        MAX_WORKERS = n_workers
+
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+
+            _executor = None
+
+
+def shutdown():
+    set_max_workers(MAX_WORKERS)
+
+
+def attach(descriptor):
+    """
+        Returns (matrix, shm). shm is the shared memory segment that must be closed after use, or None for mapped
+        files.
+    """
+
+    if descriptor[0] == "memmap":
+        _, filename, offset, shape, dtype, order = descriptor
+
+        return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape, order=order), None
+
+    _, name, shape, dtype = descriptor
+
+    shm = open_shared_memory(name)
+
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf), shm
+
+
+def fit_shared(descriptor, settings, n_components, solver_options):
+    matrix, shm = attach(descriptor)
+
+    try:
+        return engine.run(matrix, settings, n_components=n_components, **solver_options)
+    finally:
+        matrix = None
+
+        if shm is not None:
+            shm.close()
+
+
+def statistics_shared(descriptor):
+    matrix, shm = attach(descriptor)
+
+    try:
+        return stats.Statistics.from_matrix(matrix)
+    finally:
+        matrix = None
+
+        if shm is not None:
+            shm.close()
+
+
+def fit_file(path, settings, n_components):
+    return streaming.run_file(path, settings, n_components=n_components)
+
+
+def wait(future, token=None):
+    """
+        A job that already started in a worker can not be interrupted. A cancelled caller stops waiting for it and
+        its result is discarded.
+    """
+
+    with instrument.stage("worker"):
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if token is not None and token.cancelled():
+                    future.cancel()
+
+                    raise engine.Cancelled()
+
+
+def run_shared(shared, settings, n_components=2, token=None, **solver_options):
+    future = get_executor().submit(fit_shared, shared.descriptor(), settings, n_components, solver_options)
+
+    return wait(future, token)
+
+
+def run_statistics(shared, token=None):
+    return wait(get_executor().submit(statistics_shared, shared.descriptor()), token)
+
+
+def run_file(path, settings, n_components=2, token=None):
+    return wait(get_executor().submit(fit_file, path, settings, n_components), token)
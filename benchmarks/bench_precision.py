@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    Fit time and peak memory of the float32 and float64 precisions, and the accuracy of float32 against float64.
+
+    python3 benchmarks/bench_precision.py --shapes 100000x100 20000x2000 --method standardize --axis features
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ViewPCA import engine  # noqa: E402
+
+
+def parse_shape(text):
+    n_samples, n_features = text.lower().split("x")
+
+    return int(n_samples), int(n_features)
+
+
+def measure(matrix, settings, n_components, solver):
+    tracemalloc.start()
+
+    t = time.perf_counter()
+
+    result = engine.run(matrix, settings, n_components=n_components, solver=solver)
+
+    seconds = time.perf_counter() - t
+
+    peak = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.stop()
+
+    return seconds, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", type=parse_shape, nargs="+", default=[(100000, 100), (20000, 2000)],
+                        help="matrix shapes as samplesxfeatures")
+    parser.add_argument("--method", choices=engine.PREPROCESSING_METHODS, default="normalize")
+    parser.add_argument("--axis", choices=engine.PREPROCESSING_AXES, default="samples")
+    parser.add_argument("--norm", choices=engine.PREPROCESSING_NORMS, default="max")
+    parser.add_argument("--solver", choices=engine.SOLVERS, default="auto")
+    parser.add_argument("--components", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    # the first fit imports sklearn and starts the blas threads
+    engine.run(rng.normal(size=(100, 10)), engine.Settings(), n_components=2)
+
+    header = ("shape", "dtype", "fit (s)", "peak (MiB)", "angle (deg)", "score error")
+
+    print("{:>16} {:>8} {:>10} {:>12} {:>12} {:>12}".format(*header))
+
+    for shape in args.shapes:
+        # a low rank signal plus noise, stored as float32 like the detector data
+        rank = min(20, *shape)
+        matrix = (rng.normal(size=(shape[0], rank)) @ rng.normal(size=(rank, shape[1]))
+                  + 0.1 * rng.normal(size=shape)).astype(np.float32)
+
+        n_components = engine.clip_components(shape, args.components)
+
+        for precision in ("float32", "float64"):
+            settings = engine.Settings(args.method, args.axis, args.norm, precision)
+
+            seconds, peak, _ = measure(matrix, settings, n_components, args.solver)
+
+            error = {"subspace_angle": 0.0, "score_error": 0.0}
+
+            if precision == "float32":
+                error = engine.compare_precision(matrix, settings, n_components=n_components, solver=args.solver)
+
+            print("{:>16} {:>8} {:>10.3f} {:>12.1f} {:>12.2e} {:>12.2e}".format(
+                "{}x{}".format(*shape), precision, seconds, peak / 2 ** 20, error["subspace_angle"],
+                error["score_error"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    Time to first frame of the scatter chart against the number of samples. It compares the QVXYModelMapper path
+    used before with the bulk replace of ViewPCA.plotting.
+
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_render.py --samples 1000 10000 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PySide2.QtCharts import QtCharts  # noqa: E402
+from PySide2.QtWidgets import QApplication  # noqa: E402
+
+from ViewPCA import plotting  # noqa: E402
+from ViewPCA.labelarray import LabelArray  # noqa: E402
+from ViewPCA.model import Model  # noqa: E402
+
+
+def make_view():
+    chart = QtCharts.QChart()
+    chart.setAnimationOptions(QtCharts.QChart.NoAnimation)
+
+    series = QtCharts.QScatterSeries()
+    series.setMarkerSize(15)
+
+    chart.addSeries(series)
+    chart.createDefaultAxes()
+
+    view = QtCharts.QChartView(chart)
+    view.resize(800, 600)
+
+    return view, chart, series
+
+
+def first_frame_mapper(x, y):
+    view, chart, series = make_view()
+
+    model = Model()
+
+    mapper = QtCharts.QVXYModelMapper()
+    mapper.setXColumn(1)
+    mapper.setYColumn(2)
+    mapper.setSeries(series)
+    mapper.setModel(model)
+
+    t = time.perf_counter()
+
+    # set_data rebuilds the rows of the view, so the mapper reads every sample
+    model.beginResetModel()
+    model.set_data(LabelArray.row_names(x.size), np.arange(x.size), np.column_stack((x, y)))
+    model.endResetModel()
+
+    view.grab()
+
+    return time.perf_counter() - t
+
+
+def first_frame_replace(x, y):
+    view, chart, series = make_view()
+
+    t = time.perf_counter()
+
+    plotting.replace_points(series, x, y)
+
+    view.grab()
+
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--skip-mapper", action="store_true", help="the mapper path takes minutes for large sizes")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)  # noqa: F841
+
+    rng = np.random.default_rng(0)
+
+    print("{:>10} {:>12} {:>12}".format("samples", "mapper (s)", "replace (s)"))
+
+    for n in args.samples:
+        x, y = rng.normal(size=(2, n))
+
+        mapper = float("nan") if args.skip_mapper else first_frame_mapper(x, y)
+        replace = first_frame_replace(x, y)
+
+        print("{:>10} {:>12.3f} {:>12.3f}".format(n, mapper, replace))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    Startup time of the graphical interface. Each run launches a new interpreter, so the imports are cold. It
+    reports the time until the first window is shown, split in imports and window construction, and the time of
+    adding tabs. The heavy modules that were imported before the first file is opened are listed as well.
+
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_startup.py --runs 5 --tabs 5 -o startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# imported by the loads and fits. None of them should be needed to show the window
+HEAVY_MODULES = ("sklearn", "scipy", "h5py")
+
+
+def child(n_tabs):
+    t = time.perf_counter()
+
+    sys.path.insert(0, ROOT)
+
+    from PySide2.QtWidgets import QApplication
+
+    from ViewPCA.application_window import ApplicationWindow
+
+    imports = time.perf_counter() - t
+
+    t = time.perf_counter()
+
+    app = QApplication(sys.argv)
+    window = ApplicationWindow()
+
+    app.processEvents()
+
+    first_window = time.perf_counter() - t
+
+    tabs = []
+
+    for _ in range(n_tabs):
+        t = time.perf_counter()
+
+        window.add_tab()
+
+        app.processEvents()
+
+        tabs.append(time.perf_counter() - t)
+
+    heavy = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+
+    print(json.dumps({"imports": imports, "first_window": first_window, "add_tab": tabs, "heavy_modules": heavy}))
+
+
+def launch(n_tabs):
+    t = time.perf_counter()
+
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--tabs", str(n_tabs)],
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    run = json.loads(output.strip().splitlines()[-1])
+    run["process"] = time.perf_counter() - t
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tabs", type=int, default=5, help="tabs added after the first window")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("-o", "--output", help="json file with the results")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.tabs)
+
+        return
+
+    runs = [launch(args.tabs) for _ in range(args.runs)]
+
+    def describe(values):
+        return {"min": min(values), "median": statistics.median(values)}
+
+    report = {"runs": runs,
+              "process": describe([r["process"] for r in runs]),
+              "imports": describe([r["imports"] for r in runs]),
+              "first_window": describe([r["first_window"] for r in runs]),
+              "add_tab": describe([t for r in runs for t in r["add_tab"]]) if args.tabs > 0 else None,
+              "heavy_modules": runs[-1]["heavy_modules"]}
+
+    print("{:<28} {:>10} {:>10}".format("stage", "min (s)", "median (s)"))
+
+    for stage in ("process", "imports", "first_window", "add_tab"):
+        if report[stage] is not None:
+            print("{:<28} {:>10.3f} {:>10.3f}".format(stage, report[stage]["min"], report[stage]["median"]))
+
+    print("heavy modules imported at startup: {}".format(", ".join(report["heavy_modules"]) or "none"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
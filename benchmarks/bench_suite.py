@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    Times each stage of the workflow of a table on synthetic hdf5 files in the layout the GUI opens (a pca_matrix
+    dataset with a pca_sample_labels attribute): file read, preprocessing, pca fit, model reset and the first frame
+    of the chart. The results are written as json so that runs on different library versions can be compared.
+
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_suite.py --shapes 10000x100 100000x100 -o before.json
+    QT_QPA_PLATFORM=offscreen python3 benchmarks/bench_suite.py --shapes 10000x100 100000x100 --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import scipy
+import sklearn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ViewPCA import engine, loaders  # noqa: E402
+
+# preprocessing timed in the preprocess stage, as (method, axis, norm)
+PREPROCESSING = (("normalize", "samples", "max"), ("normalize", "features", "l2"), ("standardize", "features", "l1"))
+
+
+def parse_shape(text):
+    n_samples, n_features = text.lower().split("x")
+
+    return int(n_samples), int(n_features)
+
+
+def write_matrix(path, shape, dtype, chunked, rng):
+    matrix = rng.normal(size=shape).astype(dtype)
+    labels = np.array(["sample {}".format(i) for i in range(shape[0])], dtype=h5py.string_dtype())
+
+    # the latest file format stores attributes larger than 64 KiB, like the labels of large matrices
+    with h5py.File(path, "w", libver="latest") as f:
+        chunks = (min(shape[0], max(1, 2 ** 20 // (shape[1] * matrix.itemsize))), shape[1]) if chunked else None
+
+        dset = f.create_dataset("pca_matrix", data=matrix, chunks=chunks)
+        dset.attrs["pca_sample_labels"] = labels
+
+
+def measure(function, repeat):
+    """
+        Returns (seconds of each run, value returned by the last run).
+    """
+
+    times = []
+    value = None
+
+    for _ in range(repeat):
+        t = time.perf_counter()
+
+        value = function()
+
+        times.append(time.perf_counter() - t)
+
+    return times, value
+
+
+def environment():
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+                "sklearn": sklearn.__version__, "h5py": h5py.__version__, "hdf5": h5py.version.hdf5_version}
+
+    try:
+        import PySide2
+
+        versions["PySide2"] = PySide2.__version__
+    except ImportError:
+        pass
+
+    return {"versions": versions, "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count()}
+
+
+class Gui:
+    """
+        Model and offscreen chart of one table. Only created when the Qt stages are timed.
+    """
+
+    def __init__(self):
+        from PySide2.QtCharts import QtCharts
+        from PySide2.QtCore import Qt
+        from PySide2.QtWidgets import QApplication
+
+        from ViewPCA.model import Model
+
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.model_class = Model
+
+        self.chart = QtCharts.QChart()
+        self.chart.setAnimationOptions(QtCharts.QChart.NoAnimation)
+
+        self.axis_x = QtCharts.QValueAxis()
+        self.axis_y = QtCharts.QValueAxis()
+
+        self.chart.addAxis(self.axis_x, Qt.AlignBottom)
+        self.chart.addAxis(self.axis_y, Qt.AlignLeft)
+
+        self.view = QtCharts.QChartView(self.chart)
+        self.view.resize(800, 600)
+
+    def reset_model(self, labels, scores):
+        model = self.model_class()
+
+        # the packed names go to the model as the table passes them
+        model.beginResetModel()
+        model.set_data(labels, np.arange(scores.shape[0]), scores)
+        model.endResetModel()
+
+        return model
+
+    def first_frame(self, x, y):
+        from PySide2.QtCharts import QtCharts
+
+        from ViewPCA import plotting
+
+        series = QtCharts.QScatterSeries()
+        series.setMarkerSize(15)
+
+        self.chart.addSeries(series)
+
+        series.attachAxis(self.axis_x)
+        series.attachAxis(self.axis_y)
+
+        self.axis_x.setRange(x.min(), x.max())
+        self.axis_y.setRange(y.min(), y.max())
+
+        plotting.replace_points_lod(series, self.chart, x, y)
+
+        self.view.grab()
+
+        self.chart.removeSeries(series)
+
+
+def run_case(path, shape, dtype, layout, args, gui):
+    case = {"shape": list(shape), "dtype": dtype, "layout": layout, "stages": {}}
+
+    def record(stage, times, **extra):
+        case["stages"][stage] = dict(seconds=times, min=min(times), median=statistics.median(times), **extra)
+
+    # reading the whole matrix into memory. Mapped files are touched so that the pages are actually read
+    def read():
+        matrix, labels = loaders.load(path)
+
+        return np.array(matrix), labels
+
+    times, (matrix, labels) = measure(read, args.repeat)
+    record("read", times, nbytes=int(matrix.nbytes))
+
+    preprocessed = None
+
+    for method, axis, norm in PREPROCESSING:
+        settings = engine.Settings(method=method, axis=axis, norm=norm)
+
+        times, preprocessed = measure(lambda: engine.preprocess(matrix, settings), args.repeat)
+        record("preprocess_" + "_".join(settings.key()), times)
+
+    n_components = engine.clip_components(shape, args.components)
+
+    times, result = measure(lambda: engine.fit(preprocessed, n_components=n_components), args.repeat)
+    record("fit", times, solver=result.solver, n_components=n_components)
+
+    if gui is not None:
+        times, _ = measure(lambda: gui.reset_model(labels, result.scores), args.repeat)
+        record("model_reset", times)
+
+        times, _ = measure(lambda: gui.first_frame(result.scores[:, 0], result.scores[:, 1]), args.repeat)
+        record("render", times)
+
+    return case
+
+
+def case_name(case):
+    return "{}x{} {} {}".format(case["shape"][0], case["shape"][1], case["dtype"], case["layout"])
+
+
+def print_report(report, baseline=None):
+    previous = {}
+
+    if baseline is not None:
+        for case in baseline["cases"]:
+            for stage, values in case["stages"].items():
+                previous[(case_name(case), stage)] = values["min"]
+
+    print("{:<32} {:<36} {:>10} {:>10}".format("case", "stage", "min (s)", "ratio" if previous else ""))
+
+    for case in report["cases"]:
+        for stage, values in case["stages"].items():
+            key = (case_name(case), stage)
+            ratio = "{:>10.2f}".format(values["min"] / previous[key]) if previous.get(key) else ""
+
+            print("{:<32} {:<36} {:>10.4f} {}".format(case_name(case), stage, values["min"], ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", type=parse_shape, nargs="+", default=[(1000, 100), (10000, 100), (100000, 100)],
+                        help="matrix shapes as samplesxfeatures")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float64"])
+    parser.add_argument("--layouts", nargs="+", choices=("contiguous", "chunked"), default=["contiguous", "chunked"])
+    parser.add_argument("--components", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-gui", action="store_true", help="skip the model reset and render stages")
+    parser.add_argument("--keep", help="directory where the synthetic files are kept. Temporary by default")
+    parser.add_argument("-o", "--output", help="json file with the results")
+    parser.add_argument("--compare", help="json file of an earlier run. The ratio to its timings is printed")
+    args = parser.parse_args()
+
+    gui = None if args.no_gui else Gui()
+
+    rng = np.random.default_rng(0)
+
+    report = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "environment": environment(),
+              "arguments": {"components": args.components, "repeat": args.repeat}, "cases": []}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.keep or tmp
+
+        for shape in args.shapes:
+            for dtype in args.dtypes:
+                for layout in args.layouts:
+                    path = os.path.join(directory, "bench_{}x{}_{}_{}.hdf5".format(shape[0], shape[1], dtype, layout))
+
+                    if not os.path.exists(path):
+                        write_matrix(path, shape, dtype, layout == "chunked", rng)
+
+                    report["cases"].append(run_case(path, shape, dtype, layout, args, gui))
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
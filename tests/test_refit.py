@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ViewPCA import cache, engine  # noqa: E402
+
+SETTINGS = [engine.Settings("none")] + \
+    [engine.Settings("normalize", axis, norm) for axis in engine.PREPROCESSING_AXES
+     for norm in engine.PREPROCESSING_NORMS] + \
+    [engine.Settings("standardize", axis) for axis in engine.PREPROCESSING_AXES]
+
+
+def signs(scores, reference):
+    # the sign of each component is arbitrary
+    signs = np.sign(np.einsum("ij,ij->j", scores, reference))
+    signs[signs == 0] = 1.0
+
+    return signs
+
+
+@pytest.mark.parametrize("shape", [(2000, 12), (300, 40)])
+@pytest.mark.parametrize("settings", SETTINGS, ids=repr)
+def test_refit_matches_fit_of_kept_rows(shape, settings):
+    rng = np.random.default_rng(0)
+
+    matrix = rng.normal(size=shape) * rng.uniform(1.0, 5.0, shape[1]) + 3.0
+    matrix[:5] += 50.0  # outliers, the samples a user removes
+
+    kept = np.arange(5, shape[0])
+
+    store = cache.Cache()
+
+    # the full fit fills the store with the statistics and moments the refit downdates
+    cache.run(store, ("matrix",), matrix, settings, n_components=3)
+
+    refitted = cache.refit(store, ("matrix",), matrix, settings, kept, n_components=3)
+    expected = engine.run(matrix[kept], settings, n_components=3)
+
+    flip = signs(refitted.scores, expected.scores)
+
+    np.testing.assert_allclose(refitted.scores * flip, expected.scores, atol=1e-8)
+    np.testing.assert_allclose(refitted.explained_variance_ratio, expected.explained_variance_ratio, atol=1e-10)
+
+    # other samples are projected with the column statistics of the kept rows
+    np.testing.assert_allclose(engine.transform(matrix[:5], refitted) * flip, engine.transform(matrix[:5], expected),
+                               atol=1e-8)